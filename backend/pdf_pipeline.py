@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Single-pass PDF extraction shared by process_pdf.py and extract_images.py
+Opens the PDF and writes its images once, returning sections, images and pages together
+"""
+
+import sys
+import json
+from pathlib import Path
+from process_pdf import extract_pages, build_sections, save_images, resolve_images
+
+def extract_all(pdf_path, output_dir):
+    """Extract sections, images and per-page data from PDF in one pass"""
+    try:
+        pages = extract_pages(pdf_path)
+        meaningful_sections = build_sections(pages)
+        
+        # Every image is needed here, so save them all in one pass
+        filenames = save_images(pdf_path, [ref for page in pages for ref in page[3]], output_dir)
+        resolve_images(meaningful_sections, filenames)
+        
+        images = []
+        page_data = []
+        for page_num, text, _, image_refs in pages:
+            page_images = [filenames[ref] for ref in image_refs]
+            for img_index, image_filename in enumerate(page_images):
+                images.append({
+                    'page': page_num + 1,
+                    'filename': image_filename,
+                    'index': img_index
+                })
+            
+            page_data.append({
+                'page': page_num + 1,
+                'images': page_images,
+                'text_preview': text[:200] if text else ''
+            })
+        
+        return {
+            'success': True,
+            'sections': meaningful_sections[:20],  # Limit to first 20 sections
+            'total_sections': len(meaningful_sections),
+            'total_images': len(images),
+            'images': images,
+            'pages': page_data
+        }
+        
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print(json.dumps({
+            'success': False,
+            'error': 'Usage: python pdf_pipeline.py <pdf_path> <output_dir>'
+        }))
+        sys.exit(1)
+    
+    pdf_path = sys.argv[1]
+    output_dir = sys.argv[2]
+    
+    # Create output directory
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    
+    result = extract_all(pdf_path, output_dir)
+    print(json.dumps(result, indent=2))
@@ -7,102 +7,282 @@ import sys
 import json
 import os
 import re
+import statistics
 import fitz  # PyMuPDF
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-def process_pdf(pdf_path, output_dir):
-    """Process PDF and extract sections with images"""
+# Shared output helpers live in services/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'services'))
+from json_output import serve
+
+# Lines at least this much larger than the median font size are headings
+HEADING_SIZE_RATIO = 1.25
+# PyMuPDF span flag for bold text
+FONT_BOLD = 16
+# A line with the same text at the same height on this many pages is a running
+# header or footer, never a heading; POSITION_TOLERANCE is the height bucket in points
+REPEAT_MIN_PAGES = 3
+POSITION_TOLERANCE = 10
+# Text extraction flags: only what heading detection needs (no image data, no ligature handling)
+TEXT_FLAGS = fitz.TEXT_PRESERVE_WHITESPACE | fitz.TEXT_MEDIABOX_CLIP
+
+# Fallback for PDFs without font cues - heading lines matched over a page of text in one scan:
+#   1. All caps line (more than 10 chars, at least 6 capitals, no lowercase)
+#   2. Numbered heading like "1.1 Introduction"
+#   3. Unit/Chapter heading
+_HEADING_RE = re.compile(
+    r'^[^\S\n]*(?=\S)('
+    r'(?=[^\n]{10}[^\n]*\S)(?:[^a-z\n]*[A-Z]){6}[^a-z\n]*'
+    r'|\d+\.?\d*[^\S\n]+[A-Z][^\n]*'
+    r'|(?i:UNIT|CHAPTER|MODULE|SECTION)[^\S\n]+\d+[^\n]*'
+    r')$',
+    re.MULTILINE
+)
+# Whitespace around line breaks, including blank lines
+_LINE_BREAK_RE = re.compile(r'\s*\n\s*')
+
+def _write_image(image_path, image_bytes):
+    """Write image bytes to disk with a single large buffered write"""
+    with open(image_path, "wb", buffering=1 << 20) as img_file:
+        img_file.write(image_bytes)
+
+def _process_page(pdf_path, page_num):
+    """Extract text and image references for a single page (runs in a worker process)"""
+    doc = fitz.open(pdf_path)
     try:
-        doc = fitz.open(pdf_path)
-        sections = []
-        current_section = None
-        section_order = 0
+        page = doc[page_num]
         
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            
-            # Extract text
-            text = page.get_text()
-            lines = text.split('\n')
-            
-            # Extract images from this page
-            page_images = []
-            image_list = page.get_images()
-            for img_index, img in enumerate(image_list):
-                xref = img[0]
+        # Extract text lines with their font size, weight and height on the page
+        lines = []
+        text_dict = page.get_text("dict", flags=TEXT_FLAGS)
+        for block in text_dict["blocks"]:
+            for line in block.get("lines", []):
+                spans = [span for span in line["spans"] if span["text"].strip()]
+                if not spans:
+                    continue
+                line_text = "".join(span["text"] for span in line["spans"]).strip()
+                size = max(span["size"] for span in spans)
+                bold = all(span["flags"] & FONT_BOLD for span in spans)
+                lines.append((line_text, size, bold, round(line["bbox"][1] / POSITION_TOLERANCE)))
+        text = "\n".join(line[0] for line in lines)
+        
+        # Only reference images here; decoding waits until we know which are needed
+        image_refs = [(page_num, img_index, img[0]) for img_index, img in enumerate(page.get_images())]
+        
+        return page_num, text, lines, image_refs
+    finally:
+        doc.close()
+
+def _save_page_images(pdf_path, page_num, image_refs, output_dir):
+    """Decode and save the given images from one page (runs in a worker process)"""
+    doc = fitz.open(pdf_path)
+    try:
+        filenames = {}
+        
+        # Writes run on background threads so disk IO overlaps decoding the next image
+        with ThreadPoolExecutor(max_workers=2) as writer:
+            writes = []
+            for ref in image_refs:
+                _, img_index, xref = ref
                 base_image = doc.extract_image(xref)
-                image_bytes = base_image["image"]
                 image_ext = base_image["ext"]
+                image_bytes = memoryview(base_image["image"])
+                # Drop the dict so the raw bytes are freed as soon as the write finishes
+                del base_image
                 
-                # Save image
+                # Save image inside the worker so only the filename crosses processes
                 image_filename = f"page_{page_num + 1}_img_{img_index + 1}.{image_ext}"
                 image_path = os.path.join(output_dir, image_filename)
                 
-                with open(image_path, "wb") as img_file:
-                    img_file.write(image_bytes)
-                
-                page_images.append(image_filename)
+                writes.append(writer.submit(_write_image, image_path, image_bytes))
+                del image_bytes
+                filenames[ref] = image_filename
             
-            # Process lines to find headings and content
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-                
-                # Check if line is a heading (all caps, or numbered heading)
-                is_heading = False
-                
-                # Pattern 1: All caps line (at least 10 chars, mostly letters)
-                if len(line) > 10 and line.isupper() and sum(c.isalpha() for c in line) > 5:
-                    is_heading = True
-                
-                # Pattern 2: Numbered heading like "1.1 Introduction"
-                if re.match(r'^\d+\.?\d*\s+[A-Z]', line):
-                    is_heading = True
-                
-                # Pattern 3: Unit/Chapter heading
-                if re.match(r'^(UNIT|CHAPTER|MODULE|SECTION)\s+\d+', line, re.IGNORECASE):
-                    is_heading = True
-                
-                if is_heading:
-                    # Save previous section
-                    if current_section and current_section['content'].strip():
-                        sections.append(current_section)
-                        section_order += 1
-                    
-                    # Start new section
-                    current_section = {
-                        'order': section_order,
-                        'heading': line,
-                        'content': '',
-                        'images': page_images.copy() if page_images else [],
-                        'tables': [],
-                        'page': page_num + 1
-                    }
-                elif current_section:
+            # Surface any write errors
+            for write in writes:
+                write.result()
+        
+        return filenames
+    finally:
+        doc.close()
+
+def extract_pages(pdf_path):
+    """Extract text and image references for every page, returned in page order"""
+    doc = fitz.open(pdf_path)
+    page_count = doc.page_count
+    doc.close()
+    
+    # Extract pages in parallel; sections are assembled afterwards in page order
+    with ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, 4)) as pool:
+        futures = [pool.submit(_process_page, pdf_path, p) for p in range(page_count)]
+        return sorted((f.result() for f in futures), key=lambda r: r[0])
+
+def save_images(pdf_path, image_refs, output_dir):
+    """Decode and save the referenced images, returning {image_ref: filename}"""
+    by_page = {}
+    for ref in image_refs:
+        by_page.setdefault(ref[0], []).append(ref)
+    
+    filenames = {}
+    if not by_page:
+        return filenames
+    
+    with ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, 4)) as pool:
+        futures = [
+            pool.submit(_save_page_images, pdf_path, page_num, sorted(refs), output_dir)
+            for page_num, refs in by_page.items()
+        ]
+        for future in futures:
+            filenames.update(future.result())
+    
+    return filenames
+
+def resolve_images(sections, filenames):
+    """Replace the image references in sections with saved filenames"""
+    for section in sections:
+        section['images'] = [filenames[ref] for ref in section['images'] if ref in filenames]
+    return sections
+
+def _repeated_lines(pages):
+    """Return the (text, position) keys of lines repeated on REPEAT_MIN_PAGES pages or more"""
+    page_counts = {}
+    for _, _, lines, _ in pages:
+        for key in {(line_text, position) for line_text, _, _, position in lines}:
+            page_counts[key] = page_counts.get(key, 0) + 1
+    return {key for key, count in page_counts.items() if count >= REPEAT_MIN_PAGES}
+
+def _is_font_heading(line, body_size, heading_size, repeated):
+    """
+    A heading line is set noticeably larger than body text, or bold and at least
+    somewhat larger - bold alone also marks emphasis, labels and page headers
+    """
+    line_text, size, bold, position = line
+    if (line_text, position) in repeated:
+        return False
+    return size >= heading_size or (bold and size > body_size and len(line_text) > 5)
+
+def _font_segments(lines, body_size, heading_size, repeated):
+    """Split a page into (is_heading, text) segments using font size and weight"""
+    content = []
+    for line in lines:
+        line_text = line[0]
+        if _is_font_heading(line, body_size, heading_size, repeated):
+            if content:
+                yield False, '\n'.join(content)
+                content = []
+            yield True, line_text
+        else:
+            content.append(line_text)
+    if content:
+        yield False, '\n'.join(content)
+
+def _regex_segments(text):
+    """Split a page into (is_heading, text) segments with one heading regex scan"""
+    pos = 0
+    for match in _HEADING_RE.finditer(text):
+        content = _LINE_BREAK_RE.sub('\n', text[pos:match.start()]).strip()
+        if content:
+            yield False, content
+        yield True, match.group(1).strip()
+        pos = match.end()
+    content = _LINE_BREAK_RE.sub('\n', text[pos:]).strip()
+    if content:
+        yield False, content
+
+def build_sections(pages):
+    """
+    Split extracted pages into sections at detected headings
+    Section images are image references until passed through resolve_images
+    """
+    sections = []
+    current_section = None
+    content_parts = []  # Content of current_section, joined once when it is saved
+    section_image_set = set()  # Images already in current_section
+    merged_page = None  # Last page whose images were merged into current_section
+    section_order = 0
+    
+    # Headings are lines set noticeably larger than body text, or bold and larger,
+    # leaving out running headers and footers repeated across pages
+    # Documents without any such line fall back to the text patterns
+    sizes = [line[1] for _, _, lines, _ in pages for line in lines]
+    body_size = statistics.median(sizes) if sizes else 0
+    heading_size = HEADING_SIZE_RATIO * body_size
+    repeated = _repeated_lines(pages)
+    use_fonts = any(
+        _is_font_heading(line, body_size, heading_size, repeated)
+        for _, _, lines, _ in pages for line in lines
+    )
+    
+    for page_num, text, lines, page_images in pages:
+        if use_fonts:
+            segments = _font_segments(lines, body_size, heading_size, repeated)
+        else:
+            segments = _regex_segments(text)
+        
+        for is_heading, segment in segments:
+            if not is_heading:
+                if current_section:
                     # Add content to current section
-                    current_section['content'] += line + '\n'
+                    content_parts.append(segment)
+                    content_parts.append('\n')
                     
                     # Add images from this page to current section if not already added
-                    for img in page_images:
-                        if img not in current_section['images']:
-                            current_section['images'].append(img)
-        
-        # Add last section
-        if current_section and current_section['content'].strip():
-            sections.append(current_section)
-        
-        doc.close()
+                    # (once per page - they are the same for every segment on it)
+                    if merged_page != page_num:
+                        for img in page_images:
+                            if img not in section_image_set:
+                                section_image_set.add(img)
+                                current_section['images'].append(img)
+                        merged_page = page_num
+                continue
+            
+            # Save previous section
+            if current_section and content_parts:
+                current_section['content'] = ''.join(content_parts)
+                sections.append(current_section)
+                section_order += 1
+            content_parts = []
+            
+            # Start new section
+            current_section = {
+                'order': section_order,
+                'heading': segment,
+                'content': '',
+                'images': page_images.copy() if page_images else [],
+                'tables': [],
+                'page': page_num + 1
+            }
+            section_image_set = set(current_section['images'])
+            merged_page = page_num
+    
+    # Add last section
+    if current_section and content_parts:
+        current_section['content'] = ''.join(content_parts)
+        sections.append(current_section)
+    
+    # Filter sections - keep only meaningful ones
+    meaningful_sections = []
+    for section in sections:
+        # Skip very short sections or page numbers
+        if len(section['content']) > 100:
+            meaningful_sections.append(section)
+    
+    return meaningful_sections
+
+def process_pdf(pdf_path, output_dir):
+    """Process PDF and extract sections with images"""
+    try:
+        pages = extract_pages(pdf_path)
+        meaningful_sections = build_sections(pages)
+        output_sections = meaningful_sections[:20]  # Limit to first 20 sections
         
-        # Filter sections - keep only meaningful ones
-        meaningful_sections = []
-        for section in sections:
-            # Skip very short sections or page numbers
-            if len(section['content']) > 100:
-                meaningful_sections.append(section)
+        # Only decode and save images that belong to returned sections
+        needed = {ref for section in output_sections for ref in section['images']}
+        resolve_images(output_sections, save_images(pdf_path, needed, output_dir))
         
         return {
             'success': True,
-            'sections': meaningful_sections[:20],  # Limit to first 20 sections
+            'sections': output_sections,
             'total_sections': len(meaningful_sections)
         }
         
@@ -113,6 +293,10 @@ def process_pdf(pdf_path, output_dir):
         }
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--server':
+        serve(lambda req: process_pdf(req['pdf_path'], req['output_dir']))
+        sys.exit(0)
+    
     if len(sys.argv) < 3:
         print(json.dumps({
             'success': False,
@@ -6,29 +6,85 @@ Determines if images are important for learning content
 
 import sys
 import json
-import base64
+import binascii
 import os
+import functools
+import atexit
+import hashlib
+import threading
 from openai import AzureOpenAI
+from json_cache import load_json_cache, save_json_cache
+from json_output import serve
+
+@functools.lru_cache(maxsize=4)
+def _get_client(azure_endpoint, azure_key, api_version):
+    """Return a cached Azure OpenAI client so its connection pool is reused across calls"""
+    return AzureOpenAI(
+        api_key=azure_key,
+        api_version=api_version,
+        azure_endpoint=azure_endpoint
+    )
+
+# Persistent important/skip decisions keyed by image content hash
+CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'summarizer', 'important.json')
+_IMPORTANT_CACHE = None
+_cache_dirty = False
+_cache_lock = threading.Lock()
+
+def image_hash(image_bytes):
+    """Content hash of an image, used as its classification cache key"""
+    return hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+
+def _get_cache():
+    """Load the persistent classification cache on first use"""
+    global _IMPORTANT_CACHE
+    with _cache_lock:
+        if _IMPORTANT_CACHE is None:
+            _IMPORTANT_CACHE = load_json_cache(CACHE_PATH)
+            atexit.register(_save_cache)
+    return _IMPORTANT_CACHE
+
+def _save_cache():
+    """Write the classification cache to disk if it changed"""
+    with _cache_lock:
+        if not _cache_dirty:
+            return
+        try:
+            save_json_cache(CACHE_PATH, _IMPORTANT_CACHE)
+        except OSError as e:
+            print(f"Error saving classification cache: {e}", file=sys.stderr)
 
 def encode_image_base64(image_bytes):
     """Encode image bytes to base64"""
-    return base64.b64encode(image_bytes).decode('utf-8')
+    return binascii.b2a_base64(image_bytes, newline=False).decode('ascii')
+
+def image_data_url(image_bytes, image_format):
+    """Build the base64 data URL for an image in a single pass over the payload"""
+    url = b'data:image/%b;base64,%b' % (
+        image_format.encode('ascii'),
+        binascii.b2a_base64(image_bytes, newline=False)
+    )
+    return url.decode('ascii')
 
-def classify_image(image_bytes, image_format, azure_endpoint, azure_key, deployment):
+def classify_image(image_bytes, image_format, azure_endpoint, azure_key, deployment, key=None):
     """
     Use GPT-4 Vision to classify if image is important
     Returns: True if important, False if decorative
+    
+    key is the image's content hash; pass it when already computed
     """
+    global _cache_dirty
+    
+    # Identical images (in this or an earlier run) reuse the earlier decision
+    if key is None:
+        key = image_hash(image_bytes)
+    cache = _get_cache()
+    if key in cache:
+        return cache[key]
+    
     try:
-        # Initialize Azure OpenAI client
-        client = AzureOpenAI(
-            api_key=azure_key,
-            api_version="2024-02-15-preview",
-            azure_endpoint=azure_endpoint
-        )
-        
-        # Encode image
-        base64_image = encode_image_base64(image_bytes)
+        # Get (cached) Azure OpenAI client
+        client = _get_client(azure_endpoint, azure_key, "2024-02-15-preview")
         
         # Create prompt
         prompt = """Analyze this image and determine if it's important for educational/learning content.
@@ -63,7 +119,7 @@ Respond with ONLY one word: "important" or "skip"
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/{image_format};base64,{base64_image}"
+                                "url": image_data_url(image_bytes, image_format)
                             }
                         }
                     ]
@@ -77,27 +133,19 @@ Respond with ONLY one word: "important" or "skip"
         result = response.choices[0].message.content.strip().lower()
         
         # Return True if important
-        return "important" in result
+        is_important = "important" in result
+        with _cache_lock:
+            cache[key] = is_important
+            _cache_dirty = True
+        return is_important
         
     except Exception as e:
         print(f"Error classifying image: {e}", file=sys.stderr)
         # Default to including image if classification fails
         return True
 
-if __name__ == '__main__':
-    # Test with a sample image
-    if len(sys.argv) < 5:
-        print(json.dumps({
-            'success': False,
-            'error': 'Usage: python classify_image.py <image_path> <azure_endpoint> <azure_key> <deployment>'
-        }))
-        sys.exit(1)
-    
-    image_path = sys.argv[1]
-    azure_endpoint = sys.argv[2]
-    azure_key = sys.argv[3]
-    deployment = sys.argv[4]
-    
+def classify_image_file(image_path, azure_endpoint, azure_key, deployment):
+    """Classify an image file and return the CLI result"""
     # Read image
     with open(image_path, 'rb') as f:
         image_bytes = f.read()
@@ -108,11 +156,33 @@ if __name__ == '__main__':
     # Classify
     is_important = classify_image(image_bytes, image_format, azure_endpoint, azure_key, deployment)
     
-    result = {
+    return {
         'success': True,
         'image_path': image_path,
         'is_important': is_important,
         'decision': 'include' if is_important else 'skip'
     }
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--server':
+        serve(lambda req: classify_image_file(
+            req['image_path'], req['azure_endpoint'], req['azure_key'], req['deployment']
+        ))
+        sys.exit(0)
+    
+    # Test with a sample image
+    if len(sys.argv) < 5:
+        print(json.dumps({
+            'success': False,
+            'error': 'Usage: python classify_image.py <image_path> <azure_endpoint> <azure_key> <deployment>'
+        }))
+        sys.exit(1)
+    
+    image_path = sys.argv[1]
+    azure_endpoint = sys.argv[2]
+    azure_key = sys.argv[3]
+    deployment = sys.argv[4]
+    
+    result = classify_image_file(image_path, azure_endpoint, azure_key, deployment)
     
     print(json.dumps(result, indent=2))
@@ -6,48 +6,153 @@ Returns detailed metadata: classification, type, description, relevance, tags
 
 import sys
 import json
-import base64
+import binascii
 import os
+import functools
+import atexit
+import hashlib
+import threading
+import io
 from openai import AzureOpenAI
+from json_cache import load_json_cache, save_json_cache
+from json_output import serve
 
-def encode_image_base64(image_bytes):
-    """Encode image bytes to base64"""
-    return base64.b64encode(image_bytes).decode('utf-8')
+try:
+    from PIL import Image
+    HAS_PIL = True
+except ImportError:
+    HAS_PIL = False
+
+@functools.lru_cache(maxsize=4)
+def _get_client(azure_endpoint, azure_key, api_version):
+    """Return a cached Azure OpenAI client so its connection pool is reused across calls"""
+    return AzureOpenAI(
+        api_key=azure_key,
+        api_version=api_version,
+        azure_endpoint=azure_endpoint
+    )
+
+# Classifications keyed by image content + section context, persisted across runs
+CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'summarizer', 'classify.json')
+_CLASSIFY_CACHE = None
+_cache_dirty = False
+_cache_lock = threading.Lock()
+
+def _cache_key(image_bytes, context):
+    """Build the cache key for an image classified within a section context"""
+    image_hash = hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+    context_hash = hashlib.blake2b((context or '').encode('utf-8'), digest_size=8).hexdigest()
+    return f"{image_hash}:{context_hash}"
+
+def _get_cache():
+    """Load the persistent classification cache on first use"""
+    global _CLASSIFY_CACHE
+    with _cache_lock:
+        if _CLASSIFY_CACHE is None:
+            _CLASSIFY_CACHE = load_json_cache(CACHE_PATH)
+            atexit.register(save_classification_cache)
+    return _CLASSIFY_CACHE
+
+def _save_cache():
+    """Write the classification cache to disk if it changed"""
+    if not _cache_dirty:
+        return
+    try:
+        save_json_cache(CACHE_PATH, _CLASSIFY_CACHE)
+    except OSError as e:
+        print(f"Error saving classification cache: {e}", file=sys.stderr)
 
-def classify_and_describe_image(image_bytes, image_format, azure_endpoint, azure_key, deployment, context=""):
+def save_classification_cache():
+    """Save new classifications now (worker processes exit without running atexit handlers)"""
+    global _cache_dirty
+    with _cache_lock:
+        _save_cache()
+        _cache_dirty = False
+
+# Share of pixels one color must cover for an image to count as a plain background
+UNIFORM_COLOR_FRACTION = 0.98
+
+# One re-encode buffer per thread, reused for every image that thread prepares
+_local = threading.local()
+
+def _jpeg_buffer():
+    """Return this thread's re-encode buffer, emptied"""
+    buf = getattr(_local, 'jpeg_buffer', None)
+    if buf is None:
+        buf = _local.jpeg_buffer = io.BytesIO()
+    buf.seek(0)
+    buf.truncate()
+    return buf
+
+def _prepare_image(image_bytes, image_format):
     """
-    Use GPT-4 Vision to classify and describe an image
-    
-    Args:
-        image_bytes: Raw image bytes
-        image_format: Image format (jpeg, png, etc.)
-        azure_endpoint: Azure OpenAI endpoint
-        azure_key: Azure OpenAI API key
-        deployment: Deployment name
-        context: Optional context (section heading) for better classification
+    Decode the image once locally before calling the API
+    Skips obviously decorative images and shrinks the rest to a low-res JPEG
     
     Returns:
-        {
-            "is_important": bool,
-            "image_type": str,
-            "description": str,
-            "relevance_score": int (0-10),
-            "tags": list[str]
-        }
+        (classification, image_bytes, image_format) - classification is a dict
+        when the image can be skipped without AI, otherwise None
     """
+    if not HAS_PIL:
+        return None, image_bytes, image_format
+    
     try:
-        # Initialize Azure OpenAI client
-        client = AzureOpenAI(
-            api_key=azure_key,
-            api_version="2024-02-15-preview",
-            azure_endpoint=azure_endpoint
-        )
+        im = Image.open(io.BytesIO(image_bytes))
+        width, height = im.size
+        
+        # Small icons (< 50x50 pixels), same rule the prompt applies
+        if width < 50 and height < 50:
+            return {
+                'is_important': False,
+                'image_type': 'icon',
+                'description': 'Small icon skipped without AI classification',
+                'relevance_score': 0,
+                'tags': []
+            }, image_bytes, image_format
         
-        # Encode image
-        base64_image = encode_image_base64(image_bytes)
+        rgb = im.convert('RGB')
         
-        # Create comprehensive document analysis prompt
-        prompt = f"""You are a document analysis model analyzing an image from an educational/training PDF.
+        # Large areas of (nearly) flat color: backgrounds, borders, bars
+        # One color must cover almost every pixel - a few colors alone also
+        # describe 1-bit and grayscale line diagrams, which must reach the API
+        if width * height > 10000:
+            colors = rgb.getcolors(maxcolors=16)
+            if colors and max(colors)[0] > UNIFORM_COLOR_FRACTION * width * height:
+                return {
+                    'is_important': False,
+                    'image_type': 'decorative background',
+                    'description': 'Plain color image skipped without AI classification',
+                    'relevance_score': 0,
+                    'tags': []
+                }, image_bytes, image_format
+        
+        # "low" detail is downscaled to 512x512 by Azure anyway, so don't upload more
+        rgb.thumbnail((768, 768), Image.LANCZOS)
+        buf = _jpeg_buffer()
+        rgb.save(buf, 'JPEG', quality=75, optimize=True)
+        if buf.tell() < len(image_bytes):
+            return None, buf.getvalue(), 'jpeg'
+    except Exception as e:
+        print(f"Image preprocessing failed: {e}", file=sys.stderr)
+    
+    return None, image_bytes, image_format
+
+def encode_image_base64(image_bytes):
+    """Encode image bytes to base64"""
+    return binascii.b2a_base64(image_bytes, newline=False).decode('ascii')
+
+def image_data_url(image_bytes, image_format):
+    """Build the base64 data URL for an image in a single pass over the payload"""
+    url = b'data:image/%b;base64,%b' % (
+        image_format.encode('ascii'),
+        binascii.b2a_base64(image_bytes, newline=False)
+    )
+    return url.decode('ascii')
+
+def _build_messages(image_bytes, image_format, context):
+    """Build the chat messages asking GPT-4 Vision to classify one image"""
+    # Create comprehensive document analysis prompt
+    prompt = f"""You are a document analysis model analyzing an image from an educational/training PDF.
 
 CONTEXT: This image appears in a section about: "{context}"
 
@@ -121,63 +226,134 @@ Return ONLY valid JSON:
 **BE INCLUSIVE for educational content**: If an image has ANY educational value, text labels, or shows relationships, mark it as IMPORTANT.
 **BE EXCLUSIVE for decorative elements**: Page headers, banners, and design elements should be marked as decorative.
 **DEFAULT TO IMPORTANT**: When uncertain about educational value, classify as important (better to include than exclude)."""
+    
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": image_data_url(image_bytes, image_format),
+                        "detail": "low"  # Use low detail to reduce cost
+                    }
+                }
+            ]
+        }
+    ]
+
+def _parse_classification(result_text):
+    """Parse the model's JSON reply into a classification dict"""
+    try:
+        # Remove markdown code blocks if present
+        if result_text.startswith('```'):
+            result_text = result_text.split('```')[1]
+            if result_text.startswith('json'):
+                result_text = result_text[4:]
+        result_text = result_text.strip()
+        
+        result = json.loads(result_text)
+        
+        # Validate and set defaults
+        return {
+            'is_important': result.get('is_important', False),
+            'image_type': result.get('image_type', 'unknown'),
+            'description': result.get('description', ''),
+            'relevance_score': min(10, max(0, result.get('relevance_score', 5))),
+            'tags': result.get('tags', [])[:5]  # Limit to 5 tags
+        }
+        
+    except json.JSONDecodeError as e:
+        print(f"JSON parse error: {e}", file=sys.stderr)
+        print(f"Response was: {result_text}", file=sys.stderr)
+        return None
+
+def _finish_classification(key, result_text):
+    """
+    Parse the model's reply and cache it under key (None: don't cache)
+    Parse failures are not cached
+    """
+    global _cache_dirty
+    classification = _parse_classification(result_text)
+    
+    if classification is None:
+        # Return safe defaults
+        return {
+            'is_important': True,  # Default to keeping if parsing fails
+            'image_type': 'unknown',
+            'description': 'Image classification failed',
+            'relevance_score': 5,
+            'tags': []
+        }
+    
+    if key is not None:
+        cache = _get_cache()
+        # Same lock as the save, so a save never misses or trips over an insert
+        with _cache_lock:
+            cache[key] = classification
+            _cache_dirty = True
+    return classification
+
+def _error_classification():
+    """Safe defaults returned when the API call fails"""
+    return {
+        'is_important': True,  # Default to keeping on error
+        'image_type': 'unknown',
+        'description': 'Classification error',
+        'relevance_score': 5,
+        'tags': []
+    }
 
+def classify_and_describe_image(image_bytes, image_format, azure_endpoint, azure_key, deployment, context="", use_cache=True):
+    """
+    Use GPT-4 Vision to classify and describe an image
+    
+    Args:
+        image_bytes: Raw image bytes
+        image_format: Image format (jpeg, png, etc.)
+        azure_endpoint: Azure OpenAI endpoint
+        azure_key: Azure OpenAI API key
+        deployment: Deployment name
+        context: Optional context (section heading) for better classification
+        use_cache: Read and store results in the persistent cache (False always calls the API)
+    
+    Returns:
+        {
+            "is_important": bool,
+            "image_type": str,
+            "description": str,
+            "relevance_score": int (0-10),
+            "tags": list[str]
+        }
+    """
+    # Identical images in the same context reuse the earlier result
+    key = None
+    if use_cache:
+        key = _cache_key(image_bytes, context)
+        cache = _get_cache()
+        if key in cache:
+            return cache[key]
+    
+    # Skip the API for images that are decorative at a glance, shrink the rest
+    skipped, image_bytes, image_format = _prepare_image(image_bytes, image_format)
+    if skipped:
+        return skipped
+    
+    try:
+        # Get (cached) Azure OpenAI client
+        client = _get_client(azure_endpoint, azure_key, "2024-02-15-preview")
+        
         # Call GPT-4 Vision
         response = client.chat.completions.create(
             model=deployment,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/{image_format};base64,{base64_image}",
-                                "detail": "low"  # Use low detail to reduce cost
-                            }
-                        }
-                    ]
-                }
-            ],
+            messages=_build_messages(image_bytes, image_format, context),
             max_tokens=300,
             temperature=0.3  # Lower temperature for more consistent results
         )
         
-        # Get response
-        result_text = response.choices[0].message.content.strip()
-        
-        # Parse JSON response
-        try:
-            # Remove markdown code blocks if present
-            if result_text.startswith('```'):
-                result_text = result_text.split('```')[1]
-                if result_text.startswith('json'):
-                    result_text = result_text[4:]
-            result_text = result_text.strip()
-            
-            result = json.loads(result_text)
-            
-            # Validate and set defaults
-            return {
-                'is_important': result.get('is_important', False),
-                'image_type': result.get('image_type', 'unknown'),
-                'description': result.get('description', ''),
-                'relevance_score': min(10, max(0, result.get('relevance_score', 5))),
-                'tags': result.get('tags', [])[:5]  # Limit to 5 tags
-            }
-            
-        except json.JSONDecodeError as e:
-            print(f"JSON parse error: {e}", file=sys.stderr)
-            print(f"Response was: {result_text}", file=sys.stderr)
-            # Return safe defaults
-            return {
-                'is_important': True,  # Default to keeping if parsing fails
-                'image_type': 'unknown',
-                'description': 'Image classification failed',
-                'relevance_score': 5,
-                'tags': []
-            }
+        # Get response and parse JSON
+        return _finish_classification(key, response.choices[0].message.content.strip())
         
     except Exception as e:
         print(f"Error classifying image: {e}", file=sys.stderr)
@@ -185,29 +361,10 @@ Return ONLY valid JSON:
         traceback.print_exc(file=sys.stderr)
         
         # Return safe defaults on error
-        return {
-            'is_important': True,  # Default to keeping on error
-            'image_type': 'unknown',
-            'description': 'Classification error',
-            'relevance_score': 5,
-            'tags': []
-        }
+        return _error_classification()
 
-if __name__ == '__main__':
-    # Test with a sample image
-    if len(sys.argv) < 5:
-        print(json.dumps({
-            'success': False,
-            'error': 'Usage: python classify_image_enhanced.py <image_path> <azure_endpoint> <azure_key> <deployment> [context]'
-        }))
-        sys.exit(1)
-    
-    image_path = sys.argv[1]
-    azure_endpoint = sys.argv[2]
-    azure_key = sys.argv[3]
-    deployment = sys.argv[4]
-    context = sys.argv[5] if len(sys.argv) > 5 else ""
-    
+def classify_image_file(image_path, azure_endpoint, azure_key, deployment, context=""):
+    """Classify an image file and return the CLI result"""
     # Read image
     with open(image_path, 'rb') as f:
         image_bytes = f.read()
@@ -225,11 +382,35 @@ if __name__ == '__main__':
         context
     )
     
-    output = {
+    return {
         'success': True,
         'image_path': image_path,
         'context': context,
         'classification': result
     }
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--server':
+        serve(lambda req: classify_image_file(
+            req['image_path'], req['azure_endpoint'], req['azure_key'], req['deployment'],
+            req.get('context', "")
+        ))
+        sys.exit(0)
+    
+    # Test with a sample image
+    if len(sys.argv) < 5:
+        print(json.dumps({
+            'success': False,
+            'error': 'Usage: python classify_image_enhanced.py <image_path> <azure_endpoint> <azure_key> <deployment> [context]'
+        }))
+        sys.exit(1)
+    
+    image_path = sys.argv[1]
+    azure_endpoint = sys.argv[2]
+    azure_key = sys.argv[3]
+    deployment = sys.argv[4]
+    context = sys.argv[5] if len(sys.argv) > 5 else ""
+    
+    output = classify_image_file(image_path, azure_endpoint, azure_key, deployment, context)
     
     print(json.dumps(output, indent=2))
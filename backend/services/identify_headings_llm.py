@@ -7,20 +7,46 @@ Replaces regex-based heading detection with intelligent LLM analysis
 import sys
 import json
 import os
+import asyncio
+import atexit
 import fitz  # PyMuPDF
-from openai import AzureOpenAI
+from openai import AsyncAzureOpenAI
+from json_output import serve
+
+# Plain text for the LLM: no ligature or image handling
+TEXT_FLAGS = fitz.TEXT_PRESERVE_WHITESPACE | fitz.TEXT_MEDIABOX_CLIP
+
+# Documents opened once and shared by every pipeline step that reads the same PDF
+_open_documents = {}
+
+def get_or_open(pdf_path):
+    """Open a PDF once and return the same document on later calls"""
+    if pdf_path not in _open_documents:
+        _open_documents[pdf_path] = fitz.open(pdf_path)
+    return _open_documents[pdf_path]
+
+def close_pdf(pdf_path):
+    """Close a document opened with get_or_open"""
+    doc = _open_documents.pop(pdf_path, None)
+    if doc is not None:
+        doc.close()
+
+@atexit.register
+def _close_all():
+    for pdf_path in list(_open_documents):
+        close_pdf(pdf_path)
 
 def extract_pdf_text(pdf_path, max_pages=None):
-    """Extract text from PDF, page by page"""
+    """Extract text from PDF, page by page (the document stays open for later steps)"""
     try:
-        doc = fitz.open(pdf_path)
+        doc = get_or_open(pdf_path)
         pages_text = []
         
         num_pages = min(len(doc), max_pages) if max_pages else len(doc)
         
         for page_num in range(num_pages):
             page = doc[page_num]
-            text = page.get_text()
+            text = page.get_text("text", flags=TEXT_FLAGS)
             
             if text.strip():
                 pages_text.append({
@@ -28,43 +54,19 @@ def extract_pdf_text(pdf_path, max_pages=None):
                     'text': text
                 })
         
-        doc.close()
         return pages_text
         
     except Exception as e:
         print(f"Error extracting PDF text: {e}", file=sys.stderr)
         return []
 
-def identify_headings_with_llm(pages_text, azure_endpoint, azure_key, deployment):
-    """
-    Use GPT-4 to identify headings and section structure
-    
-    Returns:
-    [
-        {
-            "heading": "3. Various sub-sectors within the IT-BPM industry",
-            "level": 1,
-            "start_page": 5,
-            "context": "first 150 chars of content..."
-        }
-    ]
-    """
-    try:
-        # Initialize Azure OpenAI client
-        client = AzureOpenAI(
-            api_key=azure_key,
-            api_version="2024-02-15-preview",
-            azure_endpoint=azure_endpoint
-        )
-        
-        # Combine text from all pages
-        full_text = ""
-        for page_data in pages_text:
-            full_text += f"\n\n=== PAGE {page_data['page']} ===\n\n"
-            full_text += page_data['text']
-        
-        # Create prompt for GPT-4
-        prompt = f"""Analyze this PDF document and identify ALL section headings with their hierarchy.
+# Characters of document text sent per request, and overlap between requests
+CHUNK_SIZE = 10000
+CHUNK_OVERLAP = 1000
+
+def _build_prompt(document_text):
+    """Create the heading analysis prompt for one chunk of the document"""
+    prompt = f"""Analyze this PDF document and identify ALL section headings with their hierarchy.
 
 TASK:
 1. Find all true section headings (main topics/chapters)
@@ -90,7 +92,7 @@ HEADING CHARACTERISTICS:
 - Structurally distinct from body text
 
 PDF DOCUMENT TEXT:
-{full_text[:15000]}
+{document_text}
 
 Return ONLY a valid JSON array (no markdown, no explanation):
 [
@@ -103,92 +105,188 @@ Return ONLY a valid JSON array (no markdown, no explanation):
 ]
 
 Be thorough - include ALL meaningful section headings."""
+    return prompt
 
-        print("Sending PDF text to GPT-4 for heading analysis...", file=sys.stderr)
-        
-        # Call GPT-4
-        response = client.chat.completions.create(
-            model=deployment,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert at analyzing document structure and identifying section headings. Return only valid JSON."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            max_tokens=2000,
-            temperature=0.1  # Low temperature for consistent results
-        )
+def _split_into_chunks(full_text, page_offsets):
+    """
+    Split document text into overlapping windows
+    Each window is prefixed with the page it starts on so page numbers stay correct
+    """
+    chunks = []
+    step = CHUNK_SIZE - CHUNK_OVERLAP
+    page_index = 0
+    
+    for start in range(0, len(full_text), step):
+        # Find the page this window starts in
+        while page_index + 1 < len(page_offsets) and page_offsets[page_index + 1][0] <= start:
+            page_index += 1
+        offset, page = page_offsets[page_index]
+        
+        chunk_text = full_text[start:start + CHUNK_SIZE]
+        if start > offset:
+            chunk_text = f"=== PAGE {page} (continued) ===\n\n" + chunk_text
+        chunks.append(chunk_text)
+        
+        if start + CHUNK_SIZE >= len(full_text):
+            break
+    
+    return chunks
+
+def _parse_headings(result_text):
+    """Parse the model's JSON reply into a list of headings"""
+    try:
+        # Remove markdown code blocks if present
+        if result_text.startswith('```'):
+            result_text = result_text.split('```')[1]
+            if result_text.startswith('json'):
+                result_text = result_text[4:]
+        result_text = result_text.strip()
+        
+        headings = json.loads(result_text)
         
-        # Get response
-        result_text = response.choices[0].message.content.strip()
+        # Validate structure
+        if not isinstance(headings, list):
+            raise ValueError("Response is not a list")
         
-        print(f"GPT-4 response received ({len(result_text)} chars)", file=sys.stderr)
+        for i, h in enumerate(headings):
+            if not all(k in h for k in ['heading', 'level', 'start_page']):
+                print(f"Warning: Heading {i} missing required fields", file=sys.stderr)
         
-        # Parse JSON response
+        return headings
+        
+    except (json.JSONDecodeError, ValueError) as e:
+        print(f"JSON parse error: {e}", file=sys.stderr)
+        print(f"Response was: {result_text[:500]}", file=sys.stderr)
+        return []
+
+async def _identify_chunk(client, semaphore, chunk_text, deployment):
+    """Ask GPT-4 for the headings in one chunk of the document"""
+    async with semaphore:
         try:
-            # Remove markdown code blocks if present
-            if result_text.startswith('```'):
-                result_text = result_text.split('```')[1]
-                if result_text.startswith('json'):
-                    result_text = result_text[4:]
-            result_text = result_text.strip()
-            
-            headings = json.loads(result_text)
-            
-            print(f"✓ Identified {len(headings)} headings", file=sys.stderr)
+            response = await client.chat.completions.create(
+                model=deployment,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "You are an expert at analyzing document structure and identifying section headings. Return only valid JSON."
+                    },
+                    {
+                        "role": "user",
+                        "content": _build_prompt(chunk_text)
+                    }
+                ],
+                max_tokens=2000,
+                temperature=0.1  # Low temperature for consistent results
+            )
             
-            # Validate structure
-            if not isinstance(headings, list):
-                raise ValueError("Response is not a list")
+            result_text = response.choices[0].message.content.strip()
+            print(f"GPT-4 response received ({len(result_text)} chars)", file=sys.stderr)
+            return _parse_headings(result_text)
             
-            for i, h in enumerate(headings):
-                if not all(k in h for k in ['heading', 'level', 'start_page']):
-                    print(f"Warning: Heading {i} missing required fields", file=sys.stderr)
-            
-            return headings
-            
-        except json.JSONDecodeError as e:
-            print(f"JSON parse error: {e}", file=sys.stderr)
-            print(f"Response was: {result_text[:500]}", file=sys.stderr)
+        except Exception as e:
+            print(f"Error calling GPT-4: {e}", file=sys.stderr)
+            return []
+
+async def _identify_chunks(chunks, azure_endpoint, azure_key, deployment, max_concurrency=5):
+    """Send all chunks to GPT-4 concurrently"""
+    client = AsyncAzureOpenAI(
+        api_key=azure_key,
+        api_version="2024-02-15-preview",
+        azure_endpoint=azure_endpoint
+    )
+    semaphore = asyncio.Semaphore(max_concurrency)
+    
+    try:
+        return await asyncio.gather(*[
+            _identify_chunk(client, semaphore, chunk_text, deployment)
+            for chunk_text in chunks
+        ])
+    finally:
+        await client.close()
+
+def identify_headings_with_llm(pages_text, azure_endpoint, azure_key, deployment):
+    """
+    Use GPT-4 to identify headings and section structure
+    The document is sent as overlapping chunks so headings past the first pages are not lost
+    
+    Returns:
+    [
+        {
+            "heading": "3. Various sub-sectors within the IT-BPM industry",
+            "level": 1,
+            "start_page": 5,
+            "context": "first 150 chars of content..."
+        }
+    ]
+    """
+    try:
+        # Combine text from all pages, remembering where each page starts
+        parts = []
+        page_offsets = []
+        length = 0
+        for page_data in pages_text:
+            marker = f"\n\n=== PAGE {page_data['page']} ===\n\n"
+            page_offsets.append((length, page_data['page']))
+            parts.append(marker)
+            parts.append(page_data['text'])
+            length += len(marker) + len(page_data['text'])
+        full_text = "".join(parts)
+        
+        if not full_text:
             return []
         
+        chunks = _split_into_chunks(full_text, page_offsets)
+        
+        print(f"Sending PDF text to GPT-4 for heading analysis ({len(chunks)} chunks)...", file=sys.stderr)
+        
+        chunk_results = asyncio.run(_identify_chunks(chunks, azure_endpoint, azure_key, deployment))
+        
+        # Merge chunk results, dropping duplicates from the overlapping regions
+        headings = []
+        seen = set()
+        for chunk_headings in chunk_results:
+            for h in chunk_headings:
+                # The model sometimes returns pages as strings ("5") - normalize
+                # them to ints and drop headings without a usable page
+                try:
+                    h['start_page'] = int(h['start_page'])
+                except (KeyError, TypeError, ValueError):
+                    print(f"Warning: Dropping heading with invalid start_page: {h}", file=sys.stderr)
+                    continue
+                if h['start_page'] < 1:
+                    print(f"Warning: Dropping heading with invalid start_page: {h}", file=sys.stderr)
+                    continue
+                
+                key = (h.get('heading'), h['start_page'])
+                if key not in seen:
+                    seen.add(key)
+                    headings.append(h)
+        
+        headings.sort(key=lambda h: h['start_page'])
+        
+        print(f"✓ Identified {len(headings)} headings", file=sys.stderr)
+        
+        return headings
+        
     except Exception as e:
         print(f"Error calling GPT-4: {e}", file=sys.stderr)
         import traceback
         traceback.print_exc(file=sys.stderr)
         return []
 
-def main():
-    if len(sys.argv) < 5:
-        result = {
-            'success': False,
-            'error': 'Usage: python identify_headings_llm.py <pdf_path> <azure_endpoint> <azure_key> <deployment> [max_pages]'
-        }
-        print(json.dumps(result))
-        sys.exit(1)
-    
-    pdf_path = sys.argv[1]
-    azure_endpoint = sys.argv[2]
-    azure_key = sys.argv[3]
-    deployment = sys.argv[4]
-    max_pages = int(sys.argv[5]) if len(sys.argv) > 5 else None
-    
+def identify_pdf_headings(pdf_path, azure_endpoint, azure_key, deployment, max_pages=None):
+    """Extract text from a PDF and identify its headings, returning the CLI result"""
     try:
         # Extract text from PDF
         print(f"Extracting text from PDF...", file=sys.stderr)
         pages_text = extract_pdf_text(pdf_path, max_pages)
+        close_pdf(pdf_path)
         
         if not pages_text:
-            result = {
+            return {
                 'success': False,
                 'error': 'No text extracted from PDF'
             }
-            print(json.dumps(result))
-            sys.exit(1)
         
         print(f"✓ Extracted text from {len(pages_text)} pages", file=sys.stderr)
         
@@ -201,30 +299,54 @@ def main():
         )
         
         if not headings:
-            result = {
+            return {
                 'success': False,
                 'error': 'No headings identified'
             }
-            print(json.dumps(result))
-            sys.exit(1)
         
         # Return results
-        result = {
+        return {
             'success': True,
             'headings': headings,
             'total_headings': len(headings),
             'pages_analyzed': len(pages_text)
         }
         
-        print(json.dumps(result, indent=2))
-        
     except Exception as e:
-        result = {
+        return {
             'success': False,
             'error': str(e)
         }
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--server':
+        serve(lambda req: identify_pdf_headings(
+            req['pdf_path'], req['azure_endpoint'], req['azure_key'], req['deployment'],
+            req.get('max_pages')
+        ))
+        return
+    
+    if len(sys.argv) < 5:
+        result = {
+            'success': False,
+            'error': 'Usage: python identify_headings_llm.py <pdf_path> <azure_endpoint> <azure_key> <deployment> [max_pages]'
+        }
         print(json.dumps(result))
         sys.exit(1)
+    
+    pdf_path = sys.argv[1]
+    azure_endpoint = sys.argv[2]
+    azure_key = sys.argv[3]
+    deployment = sys.argv[4]
+    max_pages = int(sys.argv[5]) if len(sys.argv) > 5 else None
+    
+    result = identify_pdf_headings(pdf_path, azure_endpoint, azure_key, deployment, max_pages)
+    
+    if not result['success']:
+        print(json.dumps(result))
+        sys.exit(1)
+    
+    print(json.dumps(result, indent=2))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Persistent JSON caches shared by the image classification scripts
+Several processes may use the same cache file at once, so saves merge with
+what is on disk and replace the file in one step
+"""
+
+import os
+import json
+
+def load_json_cache(path):
+    """Load a cache file, or return an empty cache if it is missing or unreadable"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_json_cache(path, entries):
+    """
+    Merge entries into the cache file at path
+    Other processes may have saved since this one loaded - their entries are
+    kept, and the file is written to a private temp file and renamed into
+    place so readers never see it half written. Raises OSError on failure
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    
+    merged = load_json_cache(path)
+    merged.update(entries)
+    
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(merged, f)
+    os.replace(tmp_path, path)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+JSON output for the PDF processing scripts
+Uses orjson when it is installed, falling back to the standard library.
+Scripts run with --format msgpack write a compact msgpack result instead,
+and scripts run with --server answer JSON requests through serve()
+"""
+
+import sys
+import json
+import contextlib
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+try:
+    import msgpack
+    HAS_MSGPACK = True
+except ImportError:
+    HAS_MSGPACK = False
+
+def print_json(result):
+    """Print a result as indented JSON on stdout"""
+    if HAS_ORJSON:
+        sys.stdout.flush()
+        sys.stdout.buffer.write(orjson.dumps(result, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE))
+        sys.stdout.buffer.flush()
+    else:
+        print(json.dumps(result, indent=2))
+
+def pop_output_format(argv):
+    """Remove a '--format <json|msgpack>' option from argv and return the format"""
+    if '--format' in argv:
+        i = argv.index('--format')
+        output_format = argv[i + 1] if i + 1 < len(argv) else 'json'
+        del argv[i:i + 2]
+        return output_format
+    return 'json'
+
+def print_result(result, output_format='json'):
+    """Print a result in the given output format ('json' or 'msgpack')"""
+    if output_format != 'msgpack':
+        print_json(result)
+    elif HAS_MSGPACK:
+        sys.stdout.flush()
+        sys.stdout.buffer.write(msgpack.packb(result))
+        sys.stdout.buffer.flush()
+    else:
+        # No msgpack available - compact JSON is the next smallest format
+        print(json.dumps(result))
+
+def serve(handler):
+    """
+    Long-running mode: answer one JSON request per stdin line with one JSON line on stdout
+    The caller keeps the process alive, so imports and clients are set up once
+    instead of per PDF. Anything the handler prints goes to stderr, leaving
+    stdout for responses only
+    """
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            with contextlib.redirect_stdout(sys.stderr):
+                response = handler(json.loads(line))
+        except Exception as e:
+            response = {'success': False, 'error': str(e)}
+        sys.stdout.write(json.dumps(response) + '\n')
+        sys.stdout.flush()
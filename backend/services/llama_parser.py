@@ -8,9 +8,10 @@ import sys
 import json
 import os
 from llama_cloud_services import LlamaParse
+from json_output import serve
 
-def parse_pdf(pdf_path, api_key):
-    """Parse PDF using LlamaParser"""
+def parse_pdf_sections(pdf_path, api_key):
+    """Parse PDF using LlamaParser and return the result dict"""
     try:
         # Initialize parser
         parser = LlamaParse(
@@ -28,19 +29,24 @@ def parse_pdf(pdf_path, api_key):
         # Extract sections from markdown
         sections = []
         order = 0
+        all_md_parts = []  # Page markdown, reused if no sections are found
         
         for page in result.pages:
             markdown = page.md
+            all_md_parts.append(markdown)
             
             # Split by headings
             lines = markdown.split('\n')
             current_section = None
+            content_parts = []  # Content of current_section, joined once when it is saved
+            has_content = False
             
             for line in lines:
                 # Check if line is a heading (# or ##)
                 if line.startswith('# ') or line.startswith('## '):
                     # Save previous section
-                    if current_section and current_section['content'].strip():
+                    if current_section and has_content:
+                        current_section['content'] = ''.join(content_parts)
                         sections.append(current_section)
                         order += 1
                     
@@ -53,17 +59,22 @@ def parse_pdf(pdf_path, api_key):
                         'images': [],
                         'tables': []
                     }
+                    content_parts = []
+                    has_content = False
                 elif current_section:
-                    current_section['content'] += line + '\n'
+                    content_parts.append(line)
+                    content_parts.append('\n')
+                    has_content = has_content or bool(line.strip())
             
             # Add last section from page
-            if current_section and current_section['content'].strip():
+            if current_section and has_content:
+                current_section['content'] = ''.join(content_parts)
                 sections.append(current_section)
                 order += 1
         
         # If no sections found, create one with all content
         if not sections:
-            all_content = '\n'.join([page.md for page in result.pages])
+            all_content = '\n'.join(all_md_parts)
             sections.append({
                 'order': 0,
                 'heading': 'Document Content',
@@ -72,25 +83,29 @@ def parse_pdf(pdf_path, api_key):
                 'tables': []
             })
         
-        # Output JSON
-        output = {
+        return {
             'success': True,
             'sections': sections,
             'page_count': len(result.pages)
         }
         
-        print(json.dumps(output))
-        return 0
-        
     except Exception as e:
-        error_output = {
+        return {
             'success': False,
             'error': str(e)
         }
-        print(json.dumps(error_output))
-        return 1
+
+def parse_pdf(pdf_path, api_key):
+    """Parse PDF using LlamaParser and print JSON with sections"""
+    output = parse_pdf_sections(pdf_path, api_key)
+    print(json.dumps(output))
+    return 0 if output['success'] else 1
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--server':
+        serve(lambda req: parse_pdf_sections(req['pdf_path'], req['api_key']))
+        sys.exit(0)
+    
     if len(sys.argv) < 3:
         print(json.dumps({
             'success': False,
@@ -1,9 +1,12 @@
-const { exec } = require('child_process');
-const util = require('util');
 const path = require('path');
 const slugify = require('slugify');
+const { PythonServer } = require('./pythonServer');
 
-const execPromise = util.promisify(exec);
+// One LlamaParser process, kept running across uploads
+const llamaParser = new PythonServer(
+    path.join(__dirname, '../../venv/bin/python3'),
+    path.join(__dirname, 'llama_parser.py')
+);
 
 /**
  * Parse PDF using Python LlamaParser script
@@ -15,23 +18,11 @@ async function parsePDF(filePath, documentSlug) {
     try {
         console.log('📄 Parsing PDF with LlamaParser (Python)...');
 
-        const pythonScript = path.join(__dirname, 'llama_parser.py');
-        const pythonPath = path.join(__dirname, '../../venv/bin/python3');
-        const apiKey = process.env.LLAMAPARSE_API_KEY;
-
-        // Call Python script with virtual environment Python
-        const { stdout, stderr } = await execPromise(
-            `"${pythonPath}" "${pythonScript}" "${filePath}" "${apiKey}"`,
-            { maxBuffer: 10 * 1024 * 1024 } // 10MB buffer
-        );
-
-        // Log any stderr output (verbose logging from LlamaParser)
-        if (stderr) {
-            console.log(stderr);
-        }
-
-        // Parse JSON output
-        const result = JSON.parse(stdout);
+        // Send the PDF to the running LlamaParser script (started on first use)
+        const result = await llamaParser.request({
+            pdf_path: filePath,
+            api_key: process.env.LLAMAPARSE_API_KEY
+        });
 
         if (!result.success) {
             throw new Error(result.error || 'Unknown error from Python parser');
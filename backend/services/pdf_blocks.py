@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Shared PyMuPDF block helpers
+Used by process_pdf_blocks.py and process_pdf_ai.py
+"""
+
+import sys
+import fitz  # PyMuPDF
+from dataclasses import dataclass
+from operator import attrgetter
+
+# Block types, shared as single interned string objects by every block
+TYPE_TEXT = sys.intern('text')
+TYPE_IMAGE = sys.intern('image')
+TYPE_TABLE = sys.intern('table')
+
+# Text extraction flags: no ligature handling. TEXT_PRESERVE_IMAGES stays on even
+# though image blocks are skipped - without it MuPDF groups lines into blocks
+# differently, merging text that sits on either side of an image
+TEXT_FLAGS = fitz.TEXT_PRESERVE_WHITESPACE | fitz.TEXT_MEDIABOX_CLIP | fitz.TEXT_PRESERVE_IMAGES
+
+# Malformed-PDF warnings go to MuPDF's warning store instead of stderr
+fitz.TOOLS.mupdf_display_errors(False)
+
+@dataclass(slots=True)
+class Block:
+    """A positioned text, image or table block on a page"""
+    type: str
+    content: str
+    x: float
+    y: float
+    width: float
+    height: float
+    metadata: dict = None
+    # Tables only: page and clip rectangle for rendering the table image
+    page_num: int = None
+    clip: tuple = None
+
+def sort_by_position(items):
+    """Sort items by reading order (top to bottom, left to right)"""
+    return sorted(items, key=attrgetter('y', 'x'))
+
+def extract_text_blocks(page):
+    """Extract text blocks with positions"""
+    blocks = []
+    
+    # "blocks" yields flat (x0, y0, x1, y1, text, block_no, block_type) tuples
+    # with lines already joined by newlines - no per-span dicts are built
+    for x0, y0, x1, y1, text, _, block_type in page.get_text("blocks", flags=TEXT_FLAGS):
+        if block_type == 0:  # Text block
+            text = text.strip()
+            if text:
+                blocks.append(Block(
+                    type=TYPE_TEXT,
+                    content=text,
+                    x=x0,
+                    y=y0,
+                    width=x1 - x0,
+                    height=y1 - y0
+                ))
+    
+    return blocks
+
+def has_ruling_lines(page, min_edges=4):
+    """
+    Cheap check for vector line art that find_tables() could build a table grid from
+    Counts straight edges in the page drawings (a rectangle or quad counts as 4)
+    """
+    edges = 0
+    for drawing in page.get_drawings():
+        for item in drawing['items']:
+            if item[0] == 'l':
+                edges += 1
+            elif item[0] in ('re', 'qu'):
+                edges += 4
+            if edges >= min_edges:
+                return True
+    return False
+
+def stream_length(doc, xref):
+    """Return the stored (compressed) stream length of an xref, or None if unknown"""
+    value_type, value = doc.xref_get_key(xref, "Length")
+    return int(value) if value_type == 'int' else None
@@ -8,6 +8,7 @@ import sys
 import json
 import os
 from llama_cloud_services import LlamaParse
+from json_output import print_json
 
 def sort_by_position(items):
     """Sort layout items by reading order (top to bottom, left to right)"""
@@ -39,52 +40,56 @@ def create_block(item, order):
     
     return block
 
-def process_layout_items(pages, sections):
-    """Process layout items and assign to sections in reading order"""
+def _bbox(item):
+    """Read a layout item's bounding box, resolving its bbox attribute only once"""
+    bbox = getattr(item, 'bbox', None)
+    if bbox is None:
+        return {'x': 0, 'y': 0, 'width': 0, 'height': 0}
+    return {
+        'x': getattr(bbox, 'x', 0),
+        'y': getattr(bbox, 'y', 0),
+        'width': getattr(bbox, 'width', 0),
+        'height': getattr(bbox, 'height', 0)
+    }
+
+def layout_items(page):
+    """Copy a LlamaParse page's layout items into plain dicts"""
+    items = []
+    for item in getattr(page, 'layout', None) or ():
+        items.append({
+            'label': getattr(item, 'label', 'text'),
+            'text': getattr(item, 'text', ''),
+            'html': getattr(item, 'html', ''),
+            'image_name': getattr(item, 'image_name', ''),
+            'bbox': _bbox(item)
+        })
+    return items
+
+def page_blocks(page, text):
+    """Build the ordered blocks of one page"""
+    items = layout_items(page)
     
-    for section in sections:
-        blocks = []
-        order = 0
-        
-        # Get pages for this section (based on page range)
-        start_page = section.get('page', 1) - 1  # 0-indexed
-        end_page = start_page + 1  # For now, assume 1 page per section
-        
-        for page_num in range(start_page, min(end_page, len(pages))):
-            if page_num >= len(pages):
-                break
-                
-            page = pages[page_num]
-            
-            # Get layout items from page
-            layout_items = page.get('layout', [])
-            
-            if not layout_items:
-                # Fallback: use text if no layout
-                text = page.get('text', '')
-                if text:
-                    blocks.append({
-                        'type': 'text',
-                        'content': text,
-                        'order': order,
-                        'bbox': {}
-                    })
-                    order += 1
-                continue
-            
-            # Sort items by position
-            sorted_items = sort_by_position(layout_items)
-            
-            # Create blocks
-            for item in sorted_items:
-                block = create_block(item, order)
-                if block['content']:  # Only add non-empty blocks
-                    blocks.append(block)
-                    order += 1
-        
-        section['blocks'] = blocks
+    if not items:
+        # Fallback: use text if no layout
+        if text:
+            return [{
+                'type': 'text',
+                'content': text,
+                'order': 0,
+                'bbox': {}
+            }]
+        return []
+    
+    # Sort items by position and create blocks
+    blocks = []
+    order = 0
+    for item in sort_by_position(items):
+        block = create_block(item, order)
+        if block['content']:  # Only add non-empty blocks
+            blocks.append(block)
+            order += 1
     
-    return sections
+    return blocks
 
 def parse_pdf_with_layout(pdf_path, api_key):
     """Parse PDF using LlamaParse with layout extraction"""
@@ -104,40 +109,18 @@ def parse_pdf_with_layout(pdf_path, api_key):
         print(f"Parsing {pdf_path} with layout extraction...", file=sys.stderr)
         result = parser.parse(pdf_path)
         
-        # Extract pages and sections
-        pages = []
+        # Detect sections and fill in their blocks page by page, so no
+        # page data is kept around once its sections are built
         sections = []
         section_order = 0
+        total_pages = 0
         
         for page_num, page in enumerate(result.pages):
-            page_data = {
-                'page_num': page_num + 1,
-                'text': page.text if hasattr(page, 'text') else '',
-                'md': page.md if hasattr(page, 'md') else '',
-                'layout': []
-            }
-            
-            # Get layout items if available
-            if hasattr(page, 'layout') and page.layout:
-                for item in page.layout:
-                    layout_item = {
-                        'label': getattr(item, 'label', 'text'),
-                        'text': getattr(item, 'text', ''),
-                        'html': getattr(item, 'html', ''),
-                        'image_name': getattr(item, 'image_name', ''),
-                        'bbox': {
-                            'x': getattr(item.bbox, 'x', 0) if hasattr(item, 'bbox') else 0,
-                            'y': getattr(item.bbox, 'y', 0) if hasattr(item, 'bbox') else 0,
-                            'width': getattr(item.bbox, 'width', 0) if hasattr(item, 'bbox') else 0,
-                            'height': getattr(item.bbox, 'height', 0) if hasattr(item, 'bbox') else 0
-                        }
-                    }
-                    page_data['layout'].append(layout_item)
-            
-            pages.append(page_data)
+            total_pages += 1
+            text = getattr(page, 'text', '')
+            page_sections = []
             
             # Identify sections from headings
-            text = page_data['text']
             lines = text.split('\n')
             
             for line in lines:
@@ -157,22 +140,26 @@ def parse_pdf_with_layout(pdf_path, api_key):
                     is_heading = True
                 
                 if is_heading:
-                    sections.append({
+                    page_sections.append({
                         'order': section_order,
                         'heading': line,
                         'page': page_num + 1,
                         'blocks': []
                     })
                     section_order += 1
-        
-        # Process layout items for each section
-        sections = process_layout_items(pages, sections)
+            
+            # Each section holds the blocks of the page it starts on
+            if page_sections:
+                blocks = page_blocks(page, text)
+                for section in page_sections:
+                    section['blocks'] = list(blocks)
+                sections.extend(page_sections)
         
         return {
             'success': True,
             'sections': sections[:20],  # Limit to 20 sections
             'total_sections': len(sections),
-            'total_pages': len(pages)
+            'total_pages': total_pages
         }
         
     except Exception as e:
@@ -195,4 +182,4 @@ if __name__ == '__main__':
     api_key = sys.argv[2]
     
     result = parse_pdf_with_layout(pdf_path, api_key)
-    print(json.dumps(result, indent=2))
+    print_json(result)
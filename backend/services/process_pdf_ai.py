@@ -7,41 +7,16 @@ import sys
 import json
 import os
 import re
+import shutil
 import fitz  # PyMuPDF
-from classify_image import classify_image
+from pdf_blocks import stream_length
+from concurrent.futures import ThreadPoolExecutor
+from classify_image import classify_image, image_hash
+from json_output import print_json
 
-def sort_by_position(items):
-    """Sort items by reading order (top to bottom, left to right)"""
-    return sorted(items, key=lambda item: (
-        item.get('y', 0),
-        item.get('x', 0)
-    ))
-
-def extract_text_blocks(page):
-    """Extract text blocks with positions"""
-    blocks = []
-    text_dict = page.get_text("dict")
-    
-    for block in text_dict.get("blocks", []):
-        if block.get("type") == 0:  # Text block
-            bbox = block.get("bbox", [0, 0, 0, 0])
-            text = ""
-            for line in block.get("lines", []):
-                for span in line.get("spans", []):
-                    text += span.get("text", "")
-                text += "\n"
-            
-            if text.strip():
-                blocks.append({
-                    'type': 'text',
-                    'content': text.strip(),
-                    'x': bbox[0],
-                    'y': bbox[1],
-                    'width': bbox[2] - bbox[0],
-                    'height': bbox[3] - bbox[1]
-                })
-    
-    return blocks
+# Images below these pixel counts are decorative (icons, bullets, rules)
+MIN_IMAGE_PIXELS = 5000
+MIN_AI_IMAGE_PIXELS = 100 * 100
 
 def process_pdf_with_ai_filtering(pdf_path, output_dir, azure_endpoint, azure_key, deployment, use_ai=True):
     """
@@ -64,55 +39,106 @@ def process_pdf_with_ai_filtering(pdf_path, output_dir, azure_endpoint, azure_ke
         images_classified_skip = 0
         images_saved = 0
         
+        # (content hash, ext, size) by xref - repeated logos are only extracted
+        # once, and no image's bytes are kept for the whole document
+        seen_xrefs = {}
+        # Classification futures by content hash - identical images stored
+        # under different xrefs are classified once
+        classifications = {}
+        
         print(f"Processing {len(doc)} pages...", file=sys.stderr)
         print(f"AI filtering: {'enabled' if use_ai else 'disabled (size-based)'}", file=sys.stderr)
         
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            
-            # Extract images
-            image_list = page.get_images()
-            total_images_found += len(image_list)
-            
-            for img_index, img in enumerate(image_list):
-                try:
-                    xref = img[0]
-                    base_image = doc.extract_image(xref)
-                    image_bytes = base_image["image"]
-                    image_ext = base_image["ext"]
-                    
-                    # Decide whether to keep image
-                    should_keep = False
-                    
-                    if use_ai:
-                        # Use AI to classify
-                        print(f"  Page {page_num + 1}, Image {img_index + 1}: Classifying with AI...", file=sys.stderr)
-                        is_important = classify_image(image_bytes, image_ext, azure_endpoint, azure_key, deployment)
+        # Pass 1: extract the candidate images of every page, starting each
+        # classification as soon as its image is decoded. Vision calls are
+        # network-bound, so they run concurrently while extraction continues
+        candidates = []
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            for page_num in range(len(doc)):
+                page = doc[page_num]
+                
+                # Extract images
+                image_list = page.get_images()
+                total_images_found += len(image_list)
+                
+                for img_index, img in enumerate(image_list):
+                    try:
+                        xref = img[0]
+                        width, height = img[2], img[3]
                         
-                        if is_important:
-                            should_keep = True
-                            images_classified_important += 1
-                            print(f"    ✓ Important - keeping", file=sys.stderr)
-                        else:
-                            images_classified_skip += 1
-                            print(f"    ✗ Decorative - skipping", file=sys.stderr)
-                    else:
-                        # Use size-based filtering
-                        if len(image_bytes) >= 5000:  # 5KB threshold
-                            should_keep = True
+                        # Decide from the image dictionary where possible, without decoding
+                        if use_ai:
+                            # Too small to be a diagram or chart - no need to ask the AI
+                            if width * height < MIN_AI_IMAGE_PIXELS:
+                                images_classified_skip += 1
+                                continue
+                        elif xref not in seen_xrefs:
+                            if width * height < MIN_IMAGE_PIXELS:
+                                continue
+                            length = stream_length(doc, xref)
+                            if length is not None and length < 5000:
+                                continue
+                        
+                        if xref not in seen_xrefs:
+                            base_image = doc.extract_image(xref)
+                            image_bytes, image_ext = base_image["image"], base_image["ext"]
+                            content_hash = image_hash(image_bytes) if use_ai else None
+                            seen_xrefs[xref] = (content_hash, image_ext, len(image_bytes))
+                            
+                            # The bytes live on only until this request completes
+                            if use_ai and content_hash not in classifications:
+                                classifications[content_hash] = pool.submit(
+                                    classify_image, image_bytes, image_ext,
+                                    azure_endpoint, azure_key, deployment, key=content_hash
+                                )
+                            del base_image, image_bytes
+                        candidates.append((page_num, img_index, xref))
                     
-                    # Save if important
+                    except Exception as e:
+                        print(f"Error processing image: {e}", file=sys.stderr)
+            
+            if use_ai:
+                print(f"Classifying {len(classifications)} unique images with AI...", file=sys.stderr)
+        
+        # Pass 2: decide which images to keep
+        if use_ai:
+            decisions = [classifications[seen_xrefs[xref][0]].result() for _, _, xref in candidates]
+        else:
+            # Use size-based filtering
+            decisions = [seen_xrefs[xref][2] >= 5000 for _, _, xref in candidates]  # 5KB threshold
+        
+        # Pass 3: save the images that were kept, in page order. Each kept
+        # image is extracted again once; later pages using it copy that file
+        saved_paths = {}
+        for (page_num, img_index, xref), should_keep in zip(candidates, decisions):
+            try:
+                image_ext = seen_xrefs[xref][1]
+                
+                if use_ai:
+                    print(f"  Page {page_num + 1}, Image {img_index + 1}:", file=sys.stderr)
                     if should_keep:
-                        image_filename = f"page_{page_num + 1}_img_{img_index + 1}.{image_ext}"
-                        image_path = os.path.join(output_dir, image_filename)
-                        
+                        images_classified_important += 1
+                        print(f"    ✓ Important - keeping", file=sys.stderr)
+                    else:
+                        images_classified_skip += 1
+                        print(f"    ✗ Decorative - skipping", file=sys.stderr)
+                
+                # Save if important
+                if should_keep:
+                    image_filename = f"page_{page_num + 1}_img_{img_index + 1}.{image_ext}"
+                    image_path = os.path.join(output_dir, image_filename)
+                    
+                    if xref in saved_paths:
+                        shutil.copyfile(saved_paths[xref], image_path)
+                    else:
                         with open(image_path, "wb") as img_file:
-                            img_file.write(image_bytes)
-                        
-                        images_saved += 1
-                        
-                except Exception as e:
-                    print(f"Error processing image: {e}", file=sys.stderr)
+                            img_file.write(doc.extract_image(xref)["image"])
+                        saved_paths[xref] = image_path
+                    
+                    images_saved += 1
+                    
+            except Exception as e:
+                print(f"Error processing image: {e}", file=sys.stderr)
         
         doc.close()
         
@@ -159,7 +185,7 @@ if __name__ == '__main__':
             deployment,
             use_ai
         )
-        print(json.dumps(result, indent=2))
+        print_json(result)
     except Exception as e:
         error_result = {
             'success': False,
@@ -8,57 +8,63 @@ import sys
 import json
 import os
 import re
+import shutil
 import fitz  # PyMuPDF
+from pdf_blocks import (
+    Block, sort_by_position, extract_text_blocks, stream_length, has_ruling_lines,
+    TYPE_TEXT, TYPE_IMAGE, TYPE_TABLE
+)
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from json_output import print_json
 
-def sort_by_position(items):
-    """Sort items by reading order (top to bottom, left to right)"""
-    return sorted(items, key=lambda item: (
-        item.get('y', 0),
-        item.get('x', 0)
-    ))
-
-def extract_text_blocks(page):
-    """Extract text blocks with positions"""
-    blocks = []
-    text_dict = page.get_text("dict")
-    
-    for block in text_dict.get("blocks", []):
-        if block.get("type") == 0:  # Text block
-            bbox = block.get("bbox", [0, 0, 0, 0])
-            text = ""
-            for line in block.get("lines", []):
-                for span in line.get("spans", []):
-                    text += span.get("text", "")
-                text += "\n"
-            
-            if text.strip():
-                blocks.append({
-                    'type': 'text',
-                    'content': text.strip(),
-                    'x': bbox[0],
-                    'y': bbox[1],
-                    'width': bbox[2] - bbox[0],
-                    'height': bbox[3] - bbox[1]
-                })
-    
-    return blocks
+# Heading patterns, compiled once instead of on every line.
+# Numbered ("1.1 Overview") and Unit/Chapter/Module headings share one
+# alternation so a line is matched in a single pass
+_RE_HEADING = re.compile(
+    r'^(?:\d+\.?\d*\s+[A-Z]'
+    r'|(?i:UNIT|CHAPTER|MODULE|SECTION|TOPIC)\s+\d+)'
+)
+# Phrases that mark handbook front matter (outcomes, contents, objectives)
+_RE_METADATA = re.compile(
+    r'key learning outcomes'
+    r'|participant handbook'
+    r'|table of contents'
+    r'|unit objectives'
+    r'|at the end of this unit',
+    re.IGNORECASE
+)
+_RE_LEVEL = re.compile(r'^(\d+)(\.(\d+))?\s+')
 
 def is_metadata_section(text):
     """Check if text is from metadata sections that should be skipped"""
-    metadata_keywords = [
-        'key learning outcomes',
-        'participant handbook',
-        'table of contents',
-        'unit objectives',
-        'at the end of this unit'
-    ]
-    text_lower = text.lower()
-    return any(keyword in text_lower for keyword in metadata_keywords)
+    return _RE_METADATA.search(text) is not None
+
+def _is_allcaps_heading(line):
+    """
+    Same as len(line) > 15 and line.isupper() and more than 10 letters,
+    in one pass that stops at the first lowercase letter
+    """
+    if len(line) <= 15:
+        return False
+    letters = 0
+    has_upper = False
+    for c in line:
+        if c.isupper():
+            has_upper = True
+        elif c.islower() or c.istitle():
+            return False
+        if c.isalpha():
+            letters += 1
+    return has_upper and letters > 10
 
 def is_heading(line, allow_questions=False):
     """Check if line is a heading"""
-    line = line.strip()
-    if not line or len(line) < 5:
+    return _is_heading(line.strip(), allow_questions)
+
+def _is_heading(line, allow_questions=False):
+    """is_heading for a line that is already stripped"""
+    if len(line) < 5:
         return False
     
     # Skip metadata sections
@@ -66,16 +72,13 @@ def is_heading(line, allow_questions=False):
         return False
     
     # Pattern 1: Numbered heading like "1. Introduction" or "1.1 Overview"
-    # Must have letter after number to avoid page numbers
-    if re.match(r'^\d+\.?\d*\s+[A-Z]', line):
+    # (must have letter after number to avoid page numbers)
+    # Pattern 2: Unit/Chapter/Module heading
+    if _RE_HEADING.match(line):
         return True
     
-    # Pattern 2: All caps heading (at least 15 chars, mostly letters)
-    if len(line) > 15 and line.isupper() and sum(c.isalpha() for c in line) > 10:
-        return True
-    
-    # Pattern 3: Unit/Chapter/Module heading
-    if re.match(r'^(UNIT|CHAPTER|MODULE|SECTION|TOPIC)\s+\d+', line, re.IGNORECASE):
+    # Pattern 3: All caps heading (at least 15 chars, mostly letters)
+    if _is_allcaps_heading(line):
         return True
     
     # Pattern 4: Questions (only if allowed)
@@ -87,7 +90,7 @@ def is_heading(line, allow_questions=False):
 def get_heading_level(line):
     """Get the level of a heading (1, 2, 3, etc.)"""
     # Numbered headings: "1." is level 1, "1.1" is level 2
-    match = re.match(r'^(\d+)(\.(\d+))?\s+', line)
+    match = _RE_LEVEL.match(line)
     if match:
         if match.group(3):  # Has sub-number like "1.1"
             return 2
@@ -99,110 +102,180 @@ def get_heading_level(line):
     
     return 1
 
+# Saved images by (pdf_path, xref) - each worker process keeps its own cache
+# so repeated images (logos, banners) are only extracted once per worker.
+# Values are (filename, ext, size_bytes), or None for images that were skipped
+_seen_xrefs = {}
+
+def save_image(doc, xref, output_dir, page_num, img_index):
+    """
+    Extract an image and write it to output_dir
+    Returns (filename, ext, size_bytes), or None for very small images
+    """
+    # Skip very small images before decoding them
+    length = stream_length(doc, xref)
+    if length is not None and length < 5000:
+        return None
+    
+    base_image = doc.extract_image(xref)
+    image_bytes = base_image["image"]
+    image_ext = base_image["ext"]
+    
+    # Skip very small images (likely icons/decorations)
+    # These appear as black boxes and aren't useful
+    if len(image_bytes) < 5000:  # Less than 5KB
+        return None
+    
+    # Save image
+    image_filename = f"page_{page_num + 1}_img_{img_index + 1}.{image_ext}"
+    image_path = os.path.join(output_dir, image_filename)
+    
+    with open(image_path, "wb") as img_file:
+        img_file.write(image_bytes)
+    
+    return image_filename, image_ext, len(image_bytes)
+
+def process_one_page(pdf_path, page_num, output_dir):
+    """
+    Extract text, image and table blocks for one page (runs in a worker process)
+    Images are written to disk here so only small Block records are returned
+    """
+    doc = fitz.open(pdf_path)
+    try:
+        page = doc[page_num]
+        
+        # Extract text blocks with positions
+        text_blocks = extract_text_blocks(page)
+        
+        # Extract images and tables
+        image_list = page.get_images()
+        image_blocks = []
+        table_blocks = []
+        
+        # Detect tables by looking for table-like structures
+        # Tables often have grid patterns or are in specific regions.
+        # Pages without ruling lines (plain prose) skip table detection entirely
+        tables = page.find_tables() if has_ruling_lines(page) else None  # PyMuPDF table detection
+        
+        if tables and hasattr(tables, 'tables'):
+            for table_index, table in enumerate(tables.tables):
+                try:
+                    # Get table bounding box
+                    bbox = table.bbox
+                    
+                    # Table image is rendered later by render_tables, only if
+                    # the table ends up in a section that is returned
+                    table_filename = f"page_{page_num + 1}_table_{table_index + 1}.png"
+                    
+                    table_blocks.append(Block(
+                        type=TYPE_TABLE,
+                        content=table_filename,
+                        x=bbox[0],
+                        y=bbox[1],
+                        width=bbox[2] - bbox[0],
+                        height=bbox[3] - bbox[1],
+                        metadata={
+                            'is_table': True,
+                            'rows': len(table.rows) if hasattr(table, 'rows') else 0,
+                            'cols': len(table.header.cells) if hasattr(table, 'header') else 0
+                        },
+                        page_num=page_num,
+                        clip=tuple(bbox)
+                    ))
+                except Exception as e:
+                    print(f"Error extracting table: {e}", file=sys.stderr)
+        
+        for img_index, img in enumerate(image_list):
+            try:
+                xref = img[0]
+                key = (pdf_path, xref)
+                
+                first_seen = key not in _seen_xrefs
+                if first_seen:
+                    _seen_xrefs[key] = save_image(doc, xref, output_dir, page_num, img_index)
+                
+                saved = _seen_xrefs[key]
+                if saved is None:
+                    continue
+                image_filename, image_ext, image_size = saved
+                
+                if not first_seen:
+                    # Repeated image: copy the file already on disk instead of
+                    # keeping decoded bytes around in the worker
+                    first_path = os.path.join(output_dir, image_filename)
+                    image_filename = f"page_{page_num + 1}_img_{img_index + 1}.{image_ext}"
+                    shutil.copyfile(first_path, os.path.join(output_dir, image_filename))
+                
+                # Get image position (approximate)
+                image_blocks.append(Block(
+                    type=TYPE_IMAGE,
+                    content=image_filename,
+                    x=0,
+                    y=img_index * 100,
+                    width=0,
+                    height=0,
+                    metadata={
+                        'is_table': False,
+                        'format': image_ext,
+                        'size_bytes': image_size
+                    }
+                ))
+            except:
+                pass
+        
+        return text_blocks, image_blocks, table_blocks
+    finally:
+        doc.close()
+
+def render_tables(pdf_path, table_blocks, output_dir):
+    """Render table regions to PNG at 2x resolution"""
+    doc = fitz.open(pdf_path)
+    try:
+        for block in table_blocks:
+            try:
+                page = doc[block.page_num]
+                pix = page.get_pixmap(clip=fitz.Rect(block.clip), matrix=fitz.Matrix(2, 2))
+                pix.save(os.path.join(output_dir, block.content))
+            except Exception as e:
+                print(f"Error extracting table: {e}", file=sys.stderr)
+    finally:
+        doc.close()
+
 def process_pdf_with_blocks(pdf_path, output_dir):
     """Process PDF and create ordered blocks"""
     try:
         doc = fitz.open(pdf_path)
+        page_count = len(doc)
+        doc.close()
+        
         sections = []
         section_order = 0
         current_section = None
         in_metadata = True  # Start assuming we're in metadata
         page_threshold = 3  # Start looking for real content after page 3
         
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            
+        # Extract all pages in parallel; sections are assembled below in page order
+        with ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, 4)) as pool:
+            page_results = list(pool.map(
+                process_one_page,
+                repeat(pdf_path, page_count),
+                range(page_count),
+                repeat(output_dir, page_count)
+            ))
+        
+        for page_num, (text_blocks, image_blocks, table_blocks) in enumerate(page_results):
             # After page 3, we're likely past metadata
             if page_num >= page_threshold:
                 in_metadata = False
             
-            # Extract text blocks with positions
-            text_blocks = extract_text_blocks(page)
-            
-            # Extract images and tables
-            image_list = page.get_images()
-            image_blocks = []
-            table_blocks = []
-            
-            # Detect tables by looking for table-like structures
-            # Tables often have grid patterns or are in specific regions
-            tables = page.find_tables()  # PyMuPDF table detection
-            
-            if tables and hasattr(tables, 'tables'):
-                for table_index, table in enumerate(tables.tables):
-                    try:
-                        # Get table bounding box
-                        bbox = table.bbox
-                        
-                        # Extract table region as image
-                        table_rect = fitz.Rect(bbox)
-                        pix = page.get_pixmap(clip=table_rect, matrix=fitz.Matrix(2, 2))  # 2x resolution
-                        
-                        # Save table image
-                        table_filename = f"page_{page_num + 1}_table_{table_index + 1}.png"
-                        table_path = os.path.join(output_dir, table_filename)
-                        pix.save(table_path)
-                        
-                        table_blocks.append({
-                            'type': 'table',
-                            'content': table_filename,
-                            'x': bbox[0],
-                            'y': bbox[1],
-                            'width': bbox[2] - bbox[0],
-                            'height': bbox[3] - bbox[1],
-                            'metadata': {
-                                'is_table': True,
-                                'rows': len(table.rows) if hasattr(table, 'rows') else 0,
-                                'cols': len(table.header.cells) if hasattr(table, 'header') else 0
-                            }
-                        })
-                    except Exception as e:
-                        print(f"Error extracting table: {e}", file=sys.stderr)
-            
-            for img_index, img in enumerate(image_list):
-                try:
-                    xref = img[0]
-                    base_image = doc.extract_image(xref)
-                    image_bytes = base_image["image"]
-                    image_ext = base_image["ext"]
-                    
-                    # Skip very small images (likely icons/decorations)
-                    # These appear as black boxes and aren't useful
-                    if len(image_bytes) < 5000:  # Less than 5KB
-                        continue
-                    
-                    # Save image
-                    image_filename = f"page_{page_num + 1}_img_{img_index + 1}.{image_ext}"
-                    image_path = os.path.join(output_dir, image_filename)
-                    
-                    with open(image_path, "wb") as img_file:
-                        img_file.write(image_bytes)
-                    
-                    # Get image position (approximate)
-                    image_blocks.append({
-                        'type': 'image',
-                        'content': image_filename,
-                        'x': 0,
-                        'y': img_index * 100,
-                        'width': 0,
-                        'height': 0,
-                        'metadata': {
-                            'is_table': False,
-                            'format': image_ext,
-                            'size_bytes': len(image_bytes)
-                        }
-                    })
-                except:
-                    pass
-            
             # Combine and sort all blocks (text, images, tables)
             all_blocks = text_blocks + image_blocks + table_blocks
             sorted_blocks = sort_by_position(all_blocks)
             
             # Process blocks to identify sections
             for block in sorted_blocks:
-                if block['type'] == 'text':
-                    content = block['content']
+                if block.type == TYPE_TEXT:
+                    content = block.content
                     lines = content.split('\n')
                     
                     for line in lines:
@@ -214,8 +287,8 @@ def process_pdf_with_blocks(pdf_path, output_dir):
                         if in_metadata and is_metadata_section(line):
                             continue
                         
-                        # Check if line is a heading
-                        if is_heading(line, allow_questions=False):
+                        # Check if line is a heading (line is already stripped)
+                        if _is_heading(line, allow_questions=False):
                             # Get heading level
                             level = get_heading_level(line)
                             
@@ -240,54 +313,67 @@ def process_pdf_with_blocks(pdf_path, output_dir):
                             # Add text to current section
                             if line and len(line) > 3:  # Skip very short lines
                                 current_section['blocks'].append({
-                                    'type': 'text',
+                                    'type': TYPE_TEXT,
                                     'content': line,
                                     'order': len(current_section['blocks']),
                                     'bbox': {
-                                        'x': block['x'],
-                                        'y': block['y'],
-                                        'width': block['width'],
-                                        'height': block['height']
+                                        'x': block.x,
+                                        'y': block.y,
+                                        'width': block.width,
+                                        'height': block.height
                                     }
                                 })
-                elif block['type'] == 'image' and current_section and not in_metadata:
+                elif block.type == TYPE_IMAGE and current_section and not in_metadata:
                     # Add image to current section
                     current_section['blocks'].append({
-                        'type': 'image',
-                        'content': block['content'],
+                        'type': TYPE_IMAGE,
+                        'content': block.content,
                         'order': len(current_section['blocks']),
                         'bbox': {
-                            'x': block['x'],
-                            'y': block['y'],
-                            'width': block['width'],
-                            'height': block['height']
+                            'x': block.x,
+                            'y': block.y,
+                            'width': block.width,
+                            'height': block.height
                         },
-                        'metadata': block.get('metadata', {})
+                        'metadata': block.metadata
                     })
-                elif block['type'] == 'table' and current_section and not in_metadata:
+                elif block.type == TYPE_TABLE and current_section and not in_metadata:
                     # Add table to current section
                     current_section['blocks'].append({
-                        'type': 'table',
-                        'content': block['content'],
+                        'type': TYPE_TABLE,
+                        'content': block.content,
                         'order': len(current_section['blocks']),
                         'bbox': {
-                            'x': block['x'],
-                            'y': block['y'],
-                            'width': block['width'],
-                            'height': block['height']
+                            'x': block.x,
+                            'y': block.y,
+                            'width': block.width,
+                            'height': block.height
                         },
-                        'metadata': block.get('metadata', {})
+                        'metadata': block.metadata
                     })
         
         # Add last section
         if current_section and len(current_section['blocks']) > 3:
             sections.append(current_section)
         
-        doc.close()
-        
         # Filter meaningful sections (must have at least 5 blocks)
         meaningful_sections = [s for s in sections if len(s['blocks']) >= 5]
         
+        # Only render the tables that made it into a returned section
+        kept_tables = {
+            block['content']
+            for section in meaningful_sections[:20]
+            for block in section['blocks']
+            if block['type'] == TYPE_TABLE
+        }
+        if kept_tables:
+            render_tables(pdf_path, [
+                block
+                for _, _, table_blocks in page_results
+                for block in table_blocks
+                if block.content in kept_tables
+            ], output_dir)
+        
         return {
             'success': True,
             'sections': meaningful_sections[:20],
@@ -323,7 +409,7 @@ if __name__ == '__main__':
     
     try:
         result = process_pdf_with_blocks(pdf_path, output_dir)
-        print(json.dumps(result, indent=2))
+        print_json(result)
     except Exception as e:
         error_result = {
             'success': False,
@@ -7,43 +7,302 @@ Uses GPT-4 to identify proper headings, then extracts content for each section
 import sys
 import json
 import os
+import hashlib
+import re
 import fitz  # PyMuPDF
-from identify_headings_llm import extract_pdf_text, identify_headings_with_llm
-from classify_image_enhanced import classify_and_describe_image
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from operator import itemgetter
+from identify_headings_llm import extract_pdf_text, identify_headings_with_llm, get_or_open, close_pdf
+from classify_image_enhanced import classify_and_describe_image, save_classification_cache
+from json_output import pop_output_format, print_result
+
+# Running header/footer lines that carry no content: page numbers ("Page 3 of 40"),
+# copyright notices and bare web addresses
+_BOILERPLATE_RE = re.compile(
+    r'(?:page\s+)?\d{1,4}(?:\s+of\s+\d+)?$'
+    r'|(?:©|copyright\s*(?:©|\(c\)|\d{4}))'
+    r'|www\.\S+$',
+    re.IGNORECASE
+)
+
+# Tables are rendered at 2x resolution
+TABLE_MATRIX = fitz.Matrix(2, 2)
+
+# GPT-4V requests in flight at once, shared out across the section workers
+MAX_VISION_REQUESTS = 8
+
+def _write_raw(path, data):
+    """Write bytes straight to a file descriptor, bypassing Python's buffered file layer"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+def _save_image(path, data):
+    """
+    Write an image through a private temp file and rename it into place, so
+    workers saving the same image at once never leave a partly written file
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    _write_raw(tmp_path, data)
+    os.replace(tmp_path, path)
 
 def sort_by_position(items):
     """Sort items by reading order (top to bottom, left to right)"""
-    return sorted(items, key=lambda item: (
-        item.get('y', 0),
-        item.get('x', 0)
-    ))
+    return sorted(items, key=itemgetter('y', 'x'))
 
 def extract_text_blocks(page):
     """Extract text blocks with positions"""
     blocks = []
-    text_dict = page.get_text("dict")
     
-    for block in text_dict.get("blocks", []):
-        if block.get("type") == 0:  # Text block
-            bbox = block.get("bbox", [0, 0, 0, 0])
-            text = ""
-            for line in block.get("lines", []):
-                for span in line.get("spans", []):
-                    text += span.get("text", "")
-                text += "\n"
-            
-            if text.strip():
+    # "blocks" yields flat (x0, y0, x1, y1, text, block_no, block_type) tuples
+    # with lines already joined by newlines - no per-span dicts are built.
+    # The "dict" flags keep image blocks in, which MuPDF's block grouping depends on
+    for x0, y0, x1, y1, text, _, block_type in page.get_text("blocks", flags=fitz.TEXTFLAGS_DICT):
+        if block_type == 0:  # Text block
+            text = text.strip()
+            if text:
                 blocks.append({
                     'type': 'text',
-                    'content': text.strip(),
-                    'x': bbox[0],
-                    'y': bbox[1],
-                    'width': bbox[2] - bbox[0],
-                    'height': bbox[3] - bbox[1]
+                    'content': text,
+                    'x': x0,
+                    'y': y0,
+                    'width': x1 - x0,
+                    'height': y1 - y0
                 })
     
     return blocks
 
+def _process_section(pdf_path, output_dir, heading_info, next_heading_start, total_pages, azure_config, max_threads):
+    """
+    Extract the blocks of one section in a worker process
+    
+    Args:
+        heading_info: The section's heading dict from identify_headings_with_llm
+        next_heading_start: 1-based start page of the next heading, or None for the last section
+        total_pages: Number of pages in the document
+        azure_config: (azure_endpoint, azure_key, deployment) tuple
+        max_threads: This worker's share of MAX_VISION_REQUESTS
+    
+    Returns:
+        (section, stats_delta, saved_xrefs) - section is None when it has too few
+        blocks; saved_xrefs are the images written to output_dir
+    """
+    azure_endpoint, azure_key, deployment = azure_config
+    heading = heading_info['heading']
+    
+    # Page range (0-indexed): from the heading's page up to the page before
+    # the next heading, or to the end of the document
+    start_page = heading_info['start_page'] - 1
+    end_page = next_heading_start - 2 if next_heading_start is not None else total_pages - 1
+    
+    stats = {
+        'total_images_found': 0,
+        'images_classified_important': 0,
+        'images_classified_decorative': 0,
+        'total_tables': 0
+    }
+    
+    # Extract content for this section
+    section_blocks = []
+    current_paragraph = []
+    
+    # Classification futures by image content hash - a logo or header repeated
+    # on many pages is only sent to GPT-4V once
+    classifications = {}
+    
+    # Decoded images by xref, and the xrefs sharing each content hash -
+    # repeated images are decoded once and saved once as img_{xref}.{ext}
+    extracted_xrefs = {}
+    xrefs_by_key = {}
+    writes = []
+    saved_xrefs = set()
+    
+    # fitz documents can't be shared across processes - each worker opens its own.
+    # Images are extracted on this thread only (documents aren't thread-safe)
+    # while the pool classifies them and writes the important ones to disk
+    with fitz.open(pdf_path) as doc, ThreadPoolExecutor(max_workers=max_threads) as pool:
+        page_images = {}
+        for page_num in range(start_page, end_page + 1):
+            image_list = doc[page_num].get_images()
+            stats['total_images_found'] += len(image_list)
+            page_images[page_num] = []
+            
+            for img_index, img in enumerate(image_list):
+                try:
+                    xref = img[0]
+                    if xref not in extracted_xrefs:
+                        base_image = doc.extract_image(xref)
+                        image_bytes = base_image["image"]
+                        extracted_xrefs[xref] = (
+                            image_bytes,
+                            base_image["ext"],
+                            hashlib.blake2b(image_bytes, digest_size=16).digest()
+                        )
+                        xrefs_by_key.setdefault(extracted_xrefs[xref][2], []).append(xref)
+                    image_bytes, image_ext, key = extracted_xrefs[xref]
+                    page_images[page_num].append((xref, image_ext, key))
+                    
+                    # Start classifying now - the next images are extracted
+                    # while this one waits on the network
+                    if key not in classifications:
+                        classifications[key] = pool.submit(
+                            classify_and_describe_image,
+                            image_bytes,
+                            image_ext,
+                            azure_endpoint,
+                            azure_key,
+                            deployment,
+                            heading
+                        )
+                except Exception as e:
+                    print(f"  Error processing image: {e}", file=sys.stderr)
+        
+        # Write each important image as soon as its classification arrives
+        keys_by_future = {future: key for key, future in classifications.items()}
+        for future in as_completed(keys_by_future):
+            try:
+                if not future.result()['is_important']:
+                    continue
+                for xref in xrefs_by_key[keys_by_future[future]]:
+                    image_bytes, image_ext, _ = extracted_xrefs[xref]
+                    image_path = os.path.join(output_dir, f"img_{xref}.{image_ext}")
+                    writes.append(pool.submit(_save_image, image_path, image_bytes))
+                    saved_xrefs.add(xref)
+            except Exception as e:
+                print(f"  Error processing image: {e}", file=sys.stderr)
+        
+        for page_num in range(start_page, end_page + 1):
+            page = doc[page_num]
+            
+            # Extract text blocks
+            text_blocks = extract_text_blocks(page)
+            
+            # Add images in page order using the classifications above
+            for xref, image_ext, key in page_images[page_num]:
+                try:
+                    classification = classifications[key].result()
+                    
+                    if classification['is_important']:
+                        # Flush current paragraph before image
+                        if current_paragraph:
+                            section_blocks.append({
+                                'type': 'text',
+                                'content': ' '.join(current_paragraph),
+                                'order': len(section_blocks)
+                            })
+                            current_paragraph = []
+                        
+                        # The file itself was written (once per xref) above
+                        image_filename = f"img_{xref}.{image_ext}"
+                        
+                        stats['images_classified_important'] += 1
+                        
+                        # Add image block
+                        section_blocks.append({
+                            'type': 'image',
+                            'content': image_filename,
+                            'order': len(section_blocks),
+                            'metadata': {
+                                'ai_classified': True,
+                                'image_type': classification['image_type'],
+                                'description': classification['description'],
+                                'relevance_score': classification['relevance_score'],
+                                'tags': classification['tags']
+                            }
+                        })
+                    else:
+                        stats['images_classified_decorative'] += 1
+                        
+                except Exception as e:
+                    print(f"  Error processing image: {e}", file=sys.stderr)
+            
+            # Extract tables
+            tables = page.find_tables()
+            if tables and hasattr(tables, 'tables'):
+                # With several tables, rasterize the page once and crop each table from it
+                page_pix = None
+                if len(tables.tables) > 1:
+                    page_pix = page.get_pixmap(matrix=TABLE_MATRIX)
+                
+                for table_index, table in enumerate(tables.tables):
+                    try:
+                        # Flush current paragraph before table
+                        if current_paragraph:
+                            section_blocks.append({
+                                'type': 'text',
+                                'content': ' '.join(current_paragraph),
+                                'order': len(section_blocks)
+                            })
+                            current_paragraph = []
+                        
+                        bbox = table.bbox
+                        table_rect = fitz.Rect(bbox)
+                        if page_pix is not None:
+                            pix = fitz.Pixmap(page_pix, page_pix.width, page_pix.height, (table_rect * TABLE_MATRIX).irect)
+                        else:
+                            pix = page.get_pixmap(clip=table_rect, matrix=TABLE_MATRIX)
+                        
+                        table_filename = f"page_{page_num + 1}_table_{table_index + 1}.png"
+                        table_path = os.path.join(output_dir, table_filename)
+                        pix.save(table_path)
+                        pix = None  # Free the raster before the next table
+                        
+                        stats['total_tables'] += 1
+                        
+                        section_blocks.append({
+                            'type': 'table',
+                            'content': table_filename,
+                            'order': len(section_blocks),
+                            'metadata': {
+                                'is_table': True,
+                                'rows': len(table.rows) if hasattr(table, 'rows') else 0,
+                                'cols': len(table.header.cells) if hasattr(table, 'header') else 0
+                            }
+                        })
+                    except Exception as e:
+                        print(f"  Error extracting table: {e}", file=sys.stderr)
+                page_pix = None
+            
+            # Add text to paragraph buffer (skipping very short lines, the heading
+            # itself and page furniture like page numbers and copyright lines)
+            for block in text_blocks:
+                current_paragraph.extend(
+                    line for line in map(str.strip, block['content'].split('\n'))
+                    if len(line) > 3 and line != heading and not _BOILERPLATE_RE.match(line)
+                )
+        
+        for future in writes:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"  Error saving image: {e}", file=sys.stderr)
+    
+    # Flush final paragraph
+    if current_paragraph:
+        section_blocks.append({
+            'type': 'text',
+            'content': ' '.join(current_paragraph),
+            'order': len(section_blocks)
+        })
+    
+    # Workers exit without running atexit handlers - persist new classifications now
+    save_classification_cache()
+    
+    # Only keep sections with meaningful content
+    if len(section_blocks) < 3:
+        return None, stats, saved_xrefs
+    
+    return {
+        'heading': heading,
+        'level': heading_info.get('level', 1),
+        'page': start_page + 1,
+        'blocks': section_blocks
+    }, stats, saved_xrefs
+
 def process_pdf_with_llm_headings(pdf_path, output_dir, azure_endpoint, azure_key, deployment):
     """Process PDF using LLM-identified headings"""
     try:
@@ -55,6 +314,10 @@ def process_pdf_with_llm_headings(pdf_path, output_dir, azure_endpoint, azure_ke
         pages_text = extract_pdf_text(pdf_path)
         headings_result = identify_headings_with_llm(pages_text, azure_endpoint, azure_key, deployment)
         
+        # Sections are extracted in worker processes that open the PDF themselves
+        total_pages = len(get_or_open(pdf_path))
+        close_pdf(pdf_path)
+        
         if not headings_result:
             return {
                 'success': False,
@@ -68,9 +331,6 @@ def process_pdf_with_llm_headings(pdf_path, output_dir, azure_endpoint, azure_ke
         print("STEP 2: Extracting content for each section", file=sys.stderr)
         print("=" * 60, file=sys.stderr)
         
-        doc = fitz.open(pdf_path)
-        sections = []
-        
         stats = {
             'total_images_found': 0,
             'images_classified_important': 0,
@@ -79,159 +339,51 @@ def process_pdf_with_llm_headings(pdf_path, output_dir, azure_endpoint, azure_ke
             'total_tables': 0
         }
         
-        # Process each heading as a section
-        for idx, heading_info in enumerate(headings_result):
-            heading = heading_info['heading']
-            start_page = heading_info['start_page'] - 1  # Convert to 0-indexed
-            
-            # Determine end page (start of next section or end of document)
-            if idx < len(headings_result) - 1:
-                end_page = headings_result[idx + 1]['start_page'] - 2
-            else:
-                end_page = len(doc) - 1
-            
-            print(f"\n[{idx + 1}/{len(headings_result)}] {heading}", file=sys.stderr)
-            print(f"  Pages: {start_page + 1} to {end_page + 1}", file=sys.stderr)
-            
-            # Extract content for this section
-            section_blocks = []
-            current_paragraph = []
+        # Sections own disjoint page ranges, so they are processed in parallel -
+        # PyMuPDF work spreads over the workers and their GPT-4V calls overlap
+        next_starts = [h['start_page'] for h in headings_result[1:]] + [None]
+        azure_config = (azure_endpoint, azure_key, deployment)
+        max_workers = min(len(headings_result), os.cpu_count() or 1, 6)
+        max_threads = max(1, MAX_VISION_REQUESTS // max_workers)
+        results = {}
+        
+        # Sections sharing an image each save it - count every file once
+        saved_xrefs = set()
+        
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(
+                    _process_section, pdf_path, output_dir, heading_info,
+                    next_start, total_pages, azure_config, max_threads
+                ): idx
+                for idx, (heading_info, next_start) in enumerate(zip(headings_result, next_starts))
+            }
             
-            for page_num in range(start_page, end_page + 1):
-                page = doc[page_num]
-                
-                # Extract text blocks
-                text_blocks = extract_text_blocks(page)
-                
-                # Extract images with AI classification
-                image_list = page.get_images()
-                stats['total_images_found'] += len(image_list)
-                
-                for img_index, img in enumerate(image_list):
-                    try:
-                        xref = img[0]
-                        base_image = doc.extract_image(xref)
-                        image_bytes = base_image["image"]
-                        image_ext = base_image["ext"]
-                        
-                        # Classify with AI
-                        classification = classify_and_describe_image(
-                            image_bytes,
-                            image_ext,
-                            azure_endpoint,
-                            azure_key,
-                            deployment,
-                            context=heading
-                        )
-                        
-                        if classification['is_important']:
-                            # Flush current paragraph before image
-                            if current_paragraph:
-                                section_blocks.append({
-                                    'type': 'text',
-                                    'content': ' '.join(current_paragraph),
-                                    'order': len(section_blocks)
-                                })
-                                current_paragraph = []
-                            
-                            # Save image
-                            image_filename = f"page_{page_num + 1}_img_{img_index + 1}.{image_ext}"
-                            image_path = os.path.join(output_dir, image_filename)
-                            
-                            with open(image_path, "wb") as img_file:
-                                img_file.write(image_bytes)
-                            
-                            stats['images_classified_important'] += 1
-                            stats['images_saved'] += 1
-                            
-                            # Add image block
-                            section_blocks.append({
-                                'type': 'image',
-                                'content': image_filename,
-                                'order': len(section_blocks),
-                                'metadata': {
-                                    'ai_classified': True,
-                                    'image_type': classification['image_type'],
-                                    'description': classification['description'],
-                                    'relevance_score': classification['relevance_score'],
-                                    'tags': classification['tags']
-                                }
-                            })
-                        else:
-                            stats['images_classified_decorative'] += 1
-                            
-                    except Exception as e:
-                        print(f"  Error processing image: {e}", file=sys.stderr)
+            for future in as_completed(futures):
+                idx = futures[future]
+                heading = headings_result[idx]['heading']
+                try:
+                    section, stats_delta, section_xrefs = future.result()
+                except Exception as e:
+                    print(f"\n[{idx + 1}/{len(headings_result)}] {heading}", file=sys.stderr)
+                    print(f"  ✗ Failed: {e}", file=sys.stderr)
+                    continue
                 
-                # Extract tables
-                tables = page.find_tables()
-                if tables and hasattr(tables, 'tables'):
-                    for table_index, table in enumerate(tables.tables):
-                        try:
-                            # Flush current paragraph before table
-                            if current_paragraph:
-                                section_blocks.append({
-                                    'type': 'text',
-                                    'content': ' '.join(current_paragraph),
-                                    'order': len(section_blocks)
-                                })
-                                current_paragraph = []
-                            
-                            bbox = table.bbox
-                            table_rect = fitz.Rect(bbox)
-                            pix = page.get_pixmap(clip=table_rect, matrix=fitz.Matrix(2, 2))
-                            
-                            table_filename = f"page_{page_num + 1}_table_{table_index + 1}.png"
-                            table_path = os.path.join(output_dir, table_filename)
-                            pix.save(table_path)
-                            
-                            stats['total_tables'] += 1
-                            
-                            section_blocks.append({
-                                'type': 'table',
-                                'content': table_filename,
-                                'order': len(section_blocks),
-                                'metadata': {
-                                    'is_table': True,
-                                    'rows': len(table.rows) if hasattr(table, 'rows') else 0,
-                                    'cols': len(table.header.cells) if hasattr(table, 'header') else 0
-                                }
-                            })
-                        except Exception as e:
-                            print(f"  Error extracting table: {e}", file=sys.stderr)
+                for key, value in stats_delta.items():
+                    stats[key] += value
+                saved_xrefs.update(section_xrefs)
                 
-                # Add text to paragraph buffer
-                for block in text_blocks:
-                    lines = block['content'].split('\n')
-                    for line in lines:
-                        line = line.strip()
-                        if line and len(line) > 3:
-                            # Skip if it's the heading itself
-                            if line != heading:
-                                current_paragraph.append(line)
-            
-            # Flush final paragraph
-            if current_paragraph:
-                section_blocks.append({
-                    'type': 'text',
-                    'content': ' '.join(current_paragraph),
-                    'order': len(section_blocks)
-                })
-            
-            # Create section
-            if len(section_blocks) >= 3:  # Only keep sections with meaningful content
-                sections.append({
-                    'order': idx,
-                    'heading': heading,
-                    'level': heading_info.get('level', 1),
-                    'page': start_page + 1,
-                    'blocks': section_blocks
-                })
-                print(f"  ✓ Created section with {len(section_blocks)} blocks", file=sys.stderr)
-            else:
-                print(f"  ✗ Skipped (too few blocks)", file=sys.stderr)
+                print(f"\n[{idx + 1}/{len(headings_result)}] {heading}", file=sys.stderr)
+                if section is not None:
+                    results[idx] = section
+                    print(f"  ✓ Created section with {len(section['blocks'])} blocks", file=sys.stderr)
+                else:
+                    print(f"  ✗ Skipped (too few blocks)", file=sys.stderr)
         
-        doc.close()
+        stats['images_saved'] = len(saved_xrefs)
+        
+        # Keep the sections in document order
+        sections = [{'order': idx, **results[idx]} for idx in sorted(results)]
         
         print(f"\n{'=' * 60}", file=sys.stderr)
         print(f"PROCESSING COMPLETE", file=sys.stderr)
@@ -257,10 +409,12 @@ def process_pdf_with_llm_headings(pdf_path, output_dir, azure_endpoint, azure_ke
         }
 
 if __name__ == '__main__':
+    output_format = pop_output_format(sys.argv)
+    
     if len(sys.argv) < 6:
         result = {
             'success': False,
-            'error': 'Usage: python process_pdf_llm.py <pdf_path> <output_dir> <azure_endpoint> <azure_key> <deployment>'
+            'error': 'Usage: python process_pdf_llm.py <pdf_path> <output_dir> <azure_endpoint> <azure_key> <deployment> [--format json|msgpack]'
         }
         print(json.dumps(result))
         sys.exit(1)
@@ -273,7 +427,7 @@ if __name__ == '__main__':
     
     try:
         result = process_pdf_with_llm_headings(pdf_path, output_dir, azure_endpoint, azure_key, deployment)
-        print(json.dumps(result, indent=2))
+        print_result(result, output_format)
     except Exception as e:
         error_result = {
             'success': False,
@@ -7,46 +7,81 @@ Converts each page to image, runs OCR, extracts images, then uses LlamaParse
 import sys
 import json
 import os
+import importlib.util
 import fitz  # PyMuPDF
-from PIL import Image
-import io
-import base64
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from json_output import pop_output_format, print_result
 
-try:
-    import pytesseract
-    HAS_TESSERACT = True
-except ImportError:
-    HAS_TESSERACT = False
-    print("Warning: pytesseract not installed. OCR will be skipped.", file=sys.stderr)
+# pytesseract is imported where it is used, so runs that never OCR don't
+# pay for importing it
+HAS_TESSERACT = importlib.util.find_spec("pytesseract") is not None
 
-def pdf_page_to_image(page, dpi=300):
-    """Convert PDF page to PIL Image for OCR"""
+# Default OCR resolution, and the cap on a rendered page's longer side -
+# body text OCRs as well at this size and Tesseract's time grows with pixels
+DEFAULT_DPI = 200
+MAX_OCR_PIXELS = 2400
+
+def ocr_dpi(page, dpi=DEFAULT_DPI):
+    """Lower dpi where needed so the page's longer side stays within MAX_OCR_PIXELS"""
+    longest = max(page.rect.width, page.rect.height)
+    if longest <= 0:
+        return dpi
+    return min(dpi, MAX_OCR_PIXELS * 72 / longest)
+
+def save_page_image(page, image_path, dpi=DEFAULT_DPI):
+    """Render PDF page to a PNG file for batch OCR"""
     try:
         # Render page to pixmap at high DPI for better OCR
+        dpi = ocr_dpi(page, dpi)
         mat = fitz.Matrix(dpi/72, dpi/72)
-        pix = page.get_pixmap(matrix=mat)
-        
-        # Convert to PIL Image
-        img_data = pix.tobytes("png")
-        img = Image.open(io.BytesIO(img_data))
-        
-        return img
+        page.get_pixmap(matrix=mat).save(image_path)
+        return True
     except Exception as e:
         print(f"Error converting page to image: {e}", file=sys.stderr)
-        return None
+        return False
 
-def ocr_image(image):
-    """Run OCR on image using Tesseract"""
-    if not HAS_TESSERACT:
-        return ""
+def ocr_image_files(image_paths, work_dir):
+    """
+    Run OCR on many images with a single Tesseract process
+    Returns one text per image (Tesseract ends each page with a form feed)
+    """
+    if not HAS_TESSERACT or not image_paths:
+        return [""] * len(image_paths)
     
     try:
-        # Run Tesseract OCR
-        text = pytesseract.image_to_string(image, lang='eng')
-        return text
+        import pytesseract
+        
+        filelist_path = os.path.join(work_dir, 'filelist.txt')
+        with open(filelist_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(image_paths) + '\n')
+        
+        output_base = os.path.join(work_dir, 'ocr')
+        pytesseract.run_tesseract(filelist_path, output_base, extension='txt', lang='eng')
+        
+        with open(output_base + '.txt', 'r', encoding='utf-8') as f:
+            texts = f.read().split('\f')
+        
+        # Pad in case Tesseract produced fewer pages than expected
+        texts += [""] * (len(image_paths) - len(texts))
+        return texts[:len(image_paths)]
     except Exception as e:
         print(f"OCR error: {e}", file=sys.stderr)
-        return ""
+        return [""] * len(image_paths)
+
+def _write_raw(path, data):
+    """Write bytes straight to a file descriptor, bypassing Python's buffered file layer"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+# Saved images by (pdf_path, xref) - kept per worker process
+_saved_xrefs = {}
 
 def extract_images_from_page(page, page_num, output_dir):
     """Extract images from PDF page"""
@@ -58,22 +93,31 @@ def extract_images_from_page(page, page_num, output_dir):
         for img_index, img in enumerate(image_list):
             try:
                 xref = img[0]
-                base_image = page.parent.extract_image(xref)
-                image_bytes = base_image["image"]
-                image_ext = base_image["ext"]
-                
-                # Save image
-                image_filename = f"page_{page_num + 1}_img_{img_index + 1}.{image_ext}"
-                image_path = os.path.join(output_dir, image_filename)
+                key = (page.parent.name, xref)
                 
-                with open(image_path, "wb") as img_file:
-                    img_file.write(image_bytes)
+                # Repeated images (logos, headers) are decoded and saved once
+                if key not in _saved_xrefs:
+                    base_image = page.parent.extract_image(xref)
+                    image_bytes = base_image["image"]
+                    image_ext = base_image["ext"]
+                    
+                    # Save image (one file per xref, shared by every page that uses it)
+                    image_filename = f"img_{xref}.{image_ext}"
+                    image_path = os.path.join(output_dir, image_filename)
+                    
+                    # Write to a private temp file and rename, so workers saving
+                    # the same image at once never leave a partly written file
+                    tmp_path = f"{image_path}.{os.getpid()}.tmp"
+                    _write_raw(tmp_path, image_bytes)
+                    os.replace(tmp_path, image_path)
+                    
+                    _saved_xrefs[key] = {
+                        'filename': image_filename,
+                        'path': image_path,
+                        'size': len(image_bytes)
+                    }
                 
-                images.append({
-                    'filename': image_filename,
-                    'path': image_path,
-                    'size': len(image_bytes)
-                })
+                images.append(dict(_saved_xrefs[key]))
                 
             except Exception as e:
                 print(f"Error extracting image {img_index} from page {page_num + 1}: {e}", file=sys.stderr)
@@ -83,10 +127,73 @@ def extract_images_from_page(page, page_num, output_dir):
         print(f"Error extracting images from page {page_num + 1}: {e}", file=sys.stderr)
         return []
 
-def process_pdf_with_ocr(pdf_path, output_dir):
+def _process_one_page(pdf_path, page_num, output_dir, image_dir, force_ocr=False, dpi=DEFAULT_DPI):
+    """
+    Extract one page's native text and images, and render it for OCR (runs in a worker process)
+    The PDF is reopened here because fitz documents can't be pickled
+    OCR itself runs afterwards for all pages at once; the rendered page is
+    saved to image_dir and its path returned under 'ocr_image'
+    """
+    with fitz.open(pdf_path) as doc:
+        page = doc[page_num]
+        
+        print(f"\n[{page_num + 1}/{len(doc)}] Processing page {page_num + 1}...", file=sys.stderr)
+        
+        # Extract native text (PyMuPDF)
+        native_text = page.get_text()
+        has_native_text = len(native_text.strip()) > 50
+        
+        # Convert page to image for OCR - only needed when the native text
+        # isn't good enough to use (or OCR is forced)
+        ocr_image_path = None
+        if HAS_TESSERACT and (force_ocr or not has_native_text):
+            image_path = os.path.join(image_dir, f"page_{page_num + 1}.png")
+            if save_page_image(page, image_path, dpi):
+                ocr_image_path = image_path
+        
+        # Extract images from page
+        print(f"  Extracting images...", file=sys.stderr)
+        images = extract_images_from_page(page, page_num, output_dir)
+        print(f"  Found {len(images)} images", file=sys.stderr)
+        
+        return {
+            'page_num': page_num + 1,
+            'ocr_text': "",
+            'pymupdf_text': native_text,
+            'best_text': native_text,
+            'images': images,
+            'has_native_text': has_native_text,
+            'text_source': 'pymupdf' if has_native_text else 'ocr',
+            'ocr_image': ocr_image_path
+        }
+
+def run_ocr(pages_data, work_dir):
+    """OCR all rendered pages in one Tesseract run and fill in their text"""
+    ocr_pages = [page for page in pages_data if page['ocr_image']]
+    if ocr_pages:
+        print(f"Running OCR on {len(ocr_pages)} pages...", file=sys.stderr)
+    texts = ocr_image_files([page['ocr_image'] for page in ocr_pages], work_dir)
+    
+    for page, ocr_text in zip(ocr_pages, texts):
+        print(f"  Page {page['page_num']}: OCR extracted {len(ocr_text)} characters", file=sys.stderr)
+        page['ocr_text'] = ocr_text
+    
+    for page in pages_data:
+        del page['ocr_image']
+        # Determine best text source
+        # If native text is good, use it; otherwise use OCR
+        if not page['has_native_text']:
+            page['best_text'] = page['ocr_text']
+
+def process_pdf_with_ocr(pdf_path, output_dir, num_workers=None, force_ocr=False, dpi=DEFAULT_DPI):
     """
     Process PDF with OCR for each page
     
+    Pages are processed in parallel by num_workers processes
+    (default: up to 6, one per CPU); num_workers=1 runs sequentially.
+    Pages with enough native text are not OCR'd unless force_ocr is set.
+    Pages are rendered for OCR at dpi, capped at MAX_OCR_PIXELS on the longer side
+    
     Returns:
     {
         'pages': [
@@ -104,50 +211,38 @@ def process_pdf_with_ocr(pdf_path, output_dir):
         # Create output directory
         os.makedirs(output_dir, exist_ok=True)
         
-        # Open PDF
-        doc = fitz.open(pdf_path)
-        pages_data = []
+        # Get page count
+        with fitz.open(pdf_path) as doc:
+            page_count = len(doc)
         
-        print(f"Processing {len(doc)} pages with OCR...", file=sys.stderr)
+        if num_workers is None:
+            num_workers = min(os.cpu_count() or 1, 6)
         
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            
-            print(f"\n[{page_num + 1}/{len(doc)}] Processing page {page_num + 1}...", file=sys.stderr)
-            
-            # Extract native text (PyMuPDF)
-            native_text = page.get_text()
-            has_native_text = len(native_text.strip()) > 50
-            
-            # Convert page to image for OCR
-            ocr_text = ""
-            if HAS_TESSERACT:
-                print(f"  Running OCR...", file=sys.stderr)
-                page_image = pdf_page_to_image(page)
-                if page_image:
-                    ocr_text = ocr_image(page_image)
-                    print(f"  OCR extracted {len(ocr_text)} characters", file=sys.stderr)
-            
-            # Extract images from page
-            print(f"  Extracting images...", file=sys.stderr)
-            images = extract_images_from_page(page, page_num, output_dir)
-            print(f"  Found {len(images)} images", file=sys.stderr)
-            
-            # Determine best text source
-            # If native text is good, use it; otherwise use OCR
-            best_text = native_text if has_native_text else ocr_text
+        print(f"Processing {page_count} pages with OCR...", file=sys.stderr)
+        
+        # Rendered pages for OCR live only until the batch OCR run is done
+        with tempfile.TemporaryDirectory() as work_dir:
+            if num_workers <= 1:
+                pages_data = [
+                    _process_one_page(pdf_path, page_num, output_dir, work_dir, force_ocr, dpi)
+                    for page_num in range(page_count)
+                ]
+            else:
+                # Rendering and image extraction are CPU-bound and independent per page
+                with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                    pages_data = list(executor.map(
+                        _process_one_page,
+                        repeat(pdf_path),
+                        range(page_count),
+                        repeat(output_dir),
+                        repeat(work_dir),
+                        repeat(force_ocr),
+                        repeat(dpi),
+                        chunksize=2
+                    ))
             
-            pages_data.append({
-                'page_num': page_num + 1,
-                'ocr_text': ocr_text,
-                'pymupdf_text': native_text,
-                'best_text': best_text,
-                'images': images,
-                'has_native_text': has_native_text,
-                'text_source': 'pymupdf' if has_native_text else 'ocr'
-            })
-        
-        doc.close()
+            # One Tesseract process for all pages instead of one per page
+            run_ocr(pages_data, work_dir)
         
         return {
             'success': True,
@@ -169,28 +264,34 @@ def prepare_for_llamaparse(pages_data):
     Prepare OCR'd text for LlamaParse
     Combines all page text into a single document
     """
-    combined_text = ""
+    chunks = []
     
     for page in pages_data:
-        combined_text += f"\n\n=== PAGE {page['page_num']} ===\n\n"
-        combined_text += page['best_text']
+        chunks.append(f"\n\n=== PAGE {page['page_num']} ===\n\n")
+        chunks.append(page['best_text'])
     
-    return combined_text
+    return "".join(chunks)
 
 if __name__ == '__main__':
+    if not HAS_TESSERACT:
+        print("Warning: pytesseract not installed. OCR will be skipped.", file=sys.stderr)
+    
+    output_format = pop_output_format(sys.argv)
+    
     if len(sys.argv) < 3:
         result = {
             'success': False,
-            'error': 'Usage: python process_pdf_ocr.py <pdf_path> <output_dir>'
+            'error': 'Usage: python process_pdf_ocr.py <pdf_path> <output_dir> [dpi] [--format json|msgpack]'
         }
         print(json.dumps(result))
         sys.exit(1)
     
     pdf_path = sys.argv[1]
     output_dir = sys.argv[2]
+    dpi = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_DPI  # e.g. 150 for fast mode
     
     # Process PDF with OCR
-    result = process_pdf_with_ocr(pdf_path, output_dir)
+    result = process_pdf_with_ocr(pdf_path, output_dir, dpi=dpi)
     
     if result['success']:
         # Prepare text for LlamaParse
@@ -204,5 +305,5 @@ if __name__ == '__main__':
         result['combined_text_path'] = text_output_path
         result['combined_text_length'] = len(combined_text)
     
-    # Output JSON result
-    print(json.dumps(result, indent=2))
+    # Output result (JSON unless --format msgpack)
+    print_result(result, output_format)
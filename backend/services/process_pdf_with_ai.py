@@ -8,28 +8,136 @@ import sys
 import json
 import os
 import re
+import hashlib
+import heapq
 import fitz  # PyMuPDF
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+from operator import itemgetter
 from classify_image_enhanced import classify_and_describe_image
+from json_output import print_json
+
+try:
+    from PIL import Image, features
+    HAS_WEBP = features.check('webp')
+except ImportError:
+    HAS_WEBP = False
+
+# Images below either size are skipped as decorative before extraction:
+# pixel count, and the share of the page area they are drawn over
+MIN_IMAGE_PIXELS = 64 * 64
+MIN_IMAGE_PAGE_FRACTION = 0.002
+
+# Tables are rendered at 2x resolution
+TABLE_MATRIX = fitz.Matrix(2, 2)
+
+def _write_raw(path, data):
+    """Write bytes straight to a file descriptor, bypassing Python's buffered file layer"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+def _image_pixels(doc, xref):
+    """Pixel count of an image xref from its /Width and /Height keys, without decoding it"""
+    width_type, width = doc.xref_get_key(xref, "Width")
+    height_type, height = doc.xref_get_key(xref, "Height")
+    if width_type != 'int' or height_type != 'int':
+        return MIN_IMAGE_PIXELS  # Unknown (e.g. indirect) - let the other checks decide
+    return int(width) * int(height)
+
+# Heading and front-matter patterns, compiled once instead of on every line
+_RE_NUM_HEADING = re.compile(r'^\d+\.?\d*\s+[A-Z]')
+_RE_UNIT = re.compile(r'^(UNIT|CHAPTER|MODULE|SECTION|TOPIC)\s+\d+', re.IGNORECASE)
+_RE_LEVEL = re.compile(r'^(\d+)(\.(\d+))?\s+')
+_RE_METADATA = re.compile(
+    r'key learning outcomes'
+    r'|participant handbook'
+    r'|table of contents'
+    r'|unit objectives'
+    r'|at the end of this unit',
+    re.IGNORECASE
+)
+
+def _is_allcaps_heading(line):
+    """
+    Same as len(line) > 15 and line.isupper() and more than 10 letters,
+    in one pass that stops at the first lowercase letter
+    """
+    if len(line) <= 15:
+        return False
+    letters = 0
+    has_upper = False
+    for c in line:
+        if c.isupper():
+            has_upper = True
+        elif c.islower() or c.istitle():
+            return False
+        if c.isalpha():
+            letters += 1
+    return has_upper and letters > 10
+
+def classify_line(line):
+    """
+    Classify a stripped line in one pass: ('meta', 0) for front matter,
+    ('heading', level) for headings, ('body', 0) for everything else
+    Same results as is_metadata_section, is_heading and get_heading_level
+    """
+    if _RE_METADATA.search(line):
+        return 'meta', 0
+    
+    if len(line) >= 5 and (_RE_NUM_HEADING.match(line) or _is_allcaps_heading(line) or _RE_UNIT.match(line)):
+        # Numbered headings: "1." is level 1, "1.1" is level 2; all others are level 1
+        match = _RE_LEVEL.match(line)
+        return 'heading', 2 if match and match.group(3) else 1
+    
+    return 'body', 0
+
+# Text blocks built from paragraph buffers have no position of their own
+_EMPTY_BBOX = {'x': 0, 'y': 0, 'width': 0, 'height': 0}
+
+def _flush_paragraph(section):
+    """Append the section's buffered lines as one text block and empty the buffer"""
+    buf = section['current_paragraph']
+    if not buf:
+        return
+    section['blocks'].append({
+        'type': 'text',
+        'content': ' '.join(buf),
+        'order': len(section['blocks']),
+        'bbox': _EMPTY_BBOX
+    })
+    buf.clear()
+
+# Lines that might be headings: a superset of what classify_line accepts,
+# matched over a whole page of text at once
+# ([^\S\n] is whitespace other than a newline, so a match never spans two lines)
+_RE_HEADING_CANDIDATE = re.compile(
+    r'^[^\S\n]*(?:\d+\.?\d*[^\S\n]+[A-Z]'
+    r'|(?i:UNIT|CHAPTER|MODULE|SECTION|TOPIC)[^\S\n]+\d+'
+    r'|[^a-z\n]{16,}$)[^\n]*',
+    re.MULTILINE
+)
+
+def heading_candidates(text_blocks):
+    """
+    The stripped lines of a page that may be headings, found in one regex
+    pass over the page text; every other line is body text
+    """
+    page_text = '\n'.join(block['content'] for block in text_blocks)
+    return {match.group().strip() for match in _RE_HEADING_CANDIDATE.finditer(page_text)}
 
 # Import helper functions from original script
 def sort_by_position(items):
     """Sort items by reading order (top to bottom, left to right)"""
-    return sorted(items, key=lambda item: (
-        item.get('y', 0),
-        item.get('x', 0)
-    ))
+    return sorted(items, key=itemgetter('y', 'x'))
 
 def is_metadata_section(text):
     """Check if text is from metadata sections that should be skipped"""
-    metadata_keywords = [
-        'key learning outcomes',
-        'participant handbook',
-        'table of contents',
-        'unit objectives',
-        'at the end of this unit'
-    ]
-    text_lower = text.lower()
-    return any(keyword in text_lower for keyword in metadata_keywords)
+    return _RE_METADATA.search(text) is not None
 
 def is_heading(line, allow_questions=False):
     """Check if line is a heading"""
@@ -40,13 +148,13 @@ def is_heading(line, allow_questions=False):
     if is_metadata_section(line):
         return False
     
-    if re.match(r'^\d+\.?\d*\s+[A-Z]', line):
+    if _RE_NUM_HEADING.match(line):
         return True
     
     if len(line) > 15 and line.isupper() and sum(c.isalpha() for c in line) > 10:
         return True
     
-    if re.match(r'^(UNIT|CHAPTER|MODULE|SECTION|TOPIC)\s+\d+', line, re.IGNORECASE):
+    if _RE_UNIT.match(line):
         return True
     
     if allow_questions and line.endswith('?') and len(line) > 20:
@@ -56,7 +164,7 @@ def is_heading(line, allow_questions=False):
 
 def get_heading_level(line):
     """Get the level of a heading (1, 2, 3, etc.)"""
-    match = re.match(r'^(\d+)(\.(\d+))?\s+', line)
+    match = _RE_LEVEL.match(line)
     if match:
         if match.group(3):
             return 2
@@ -70,34 +178,160 @@ def get_heading_level(line):
 def extract_text_blocks(page):
     """Extract text blocks with positions"""
     blocks = []
-    text_dict = page.get_text("dict")
     
-    for block in text_dict.get("blocks", []):
-        if block.get("type") == 0:  # Text block
-            bbox = block.get("bbox", [0, 0, 0, 0])
-            text = ""
-            for line in block.get("lines", []):
-                for span in line.get("spans", []):
-                    text += span.get("text", "")
-                text += "\n"
-            
-            if text.strip():
+    # "blocks" yields flat (x0, y0, x1, y1, text, block_no, block_type) tuples
+    # with lines already joined by newlines - no per-span dicts are built.
+    # The "dict" flags keep image blocks in, which MuPDF's block grouping depends on
+    for x0, y0, x1, y1, text, _, block_type in page.get_text("blocks", flags=fitz.TEXTFLAGS_DICT):
+        if block_type == 0:  # Text block
+            text = text.strip()
+            if text:
                 blocks.append({
                     'type': 'text',
-                    'content': text.strip(),
+                    'content': text,
+                    'x': x0,
+                    'y': y0,
+                    'width': x1 - x0,
+                    'height': y1 - y0
+                })
+    
+    return blocks
+
+# Open documents by path - each worker process parses the PDF once, not once per page
+_open_documents = {}
+
+def get_or_open(pdf_path):
+    """
+    Open a PDF once per process and return the same document on later calls
+    The file is read in one go and opened from memory, so forked workers
+    that inherit the document never share a file offset
+    """
+    if pdf_path not in _open_documents:
+        with open(pdf_path, 'rb') as f:
+            _open_documents[pdf_path] = fitz.open(stream=f.read(), filetype='pdf')
+    return _open_documents[pdf_path]
+
+def close_pdf(pdf_path):
+    """Close a document opened with get_or_open"""
+    doc = _open_documents.pop(pdf_path, None)
+    if doc is not None:
+        doc.close()
+
+def parse_page(pdf_path, page_num, output_dir):
+    """
+    Parse one page in a worker process: text blocks, image xrefs and tables
+    (tables are rendered to output_dir here, where the page is already loaded)
+    """
+    doc = get_or_open(pdf_path)
+    page = doc[page_num]
+    
+    # Extract text blocks
+    text_blocks = extract_text_blocks(page)
+    
+    images = page.get_images()
+    image_xrefs = [img[0] for img in images]
+    
+    # Images too small to matter, judged from their metadata alone. First
+    # from the image dictionaries: few pixels, or soft masks of other images
+    smask_xrefs = {img[1] for img in images if img[1]}
+    tiny_xrefs = {
+        xref for xref in image_xrefs
+        if xref in smask_xrefs or _image_pixels(doc, xref) < MIN_IMAGE_PIXELS
+    }
+    
+    # Then from the layout: drawn over a tiny part of the page (largest placement)
+    shown = {}
+    for info in page.get_image_info(xrefs=True):
+        bbox = fitz.Rect(info['bbox'])
+        shown[info['xref']] = max(shown.get(info['xref'], 0), bbox.width * bbox.height)
+    min_shown = MIN_IMAGE_PAGE_FRACTION * page.rect.width * page.rect.height
+    tiny_xrefs.update(xref for xref, area in shown.items() if area < min_shown)
+    
+    # Extract tables
+    table_blocks = []
+    tables = page.find_tables()
+    
+    if tables and hasattr(tables, 'tables'):
+        for table_index, table in enumerate(tables.tables):
+            try:
+                bbox = table.bbox
+                table_rect = fitz.Rect(bbox)
+                pix = page.get_pixmap(clip=table_rect, matrix=TABLE_MATRIX)
+                
+                if HAS_WEBP:
+                    # WebP encodes faster and far smaller than PNG
+                    table_filename = f"page_{page_num + 1}_table_{table_index + 1}.webp"
+                    table_path = os.path.join(output_dir, table_filename)
+                    Image.frombytes("RGB", (pix.width, pix.height), pix.samples).save(
+                        table_path, 'WEBP', quality=80
+                    )
+                else:
+                    table_filename = f"page_{page_num + 1}_table_{table_index + 1}.png"
+                    table_path = os.path.join(output_dir, table_filename)
+                    pix.save(table_path)
+                
+                table_blocks.append({
+                    'type': 'table',
+                    'content': table_filename,
                     'x': bbox[0],
                     'y': bbox[1],
                     'width': bbox[2] - bbox[0],
-                    'height': bbox[3] - bbox[1]
+                    'height': bbox[3] - bbox[1],
+                    'metadata': {
+                        'is_table': True,
+                        'rows': len(table.rows) if hasattr(table, 'rows') else 0,
+                        'cols': len(table.header.cells) if hasattr(table, 'header') else 0
+                    }
                 })
+            except Exception as e:
+                print(f"Error extracting table: {e}", file=sys.stderr)
     
-    return blocks
+    return {
+        # Both lists in reading order, so the blocks of a page can be merged
+        'text_blocks': sort_by_position(text_blocks),
+        'image_xrefs': image_xrefs,
+        'tiny_xrefs': tiny_xrefs,
+        'heading_candidates': heading_candidates(text_blocks),
+        'table_blocks': sort_by_position(table_blocks)
+    }
 
-def process_pdf_with_ai(pdf_path, output_dir, azure_endpoint, azure_key, deployment):
-    """Process PDF with AI-powered image classification"""
+def process_pdf_with_ai(pdf_path, output_dir, azure_endpoint, azure_key, deployment, num_workers=None, sections_out_path=None):
+    """
+    Process PDF with AI-powered image classification
+    
+    Pages are parsed in parallel by num_workers processes
+    (default: up to 4, one per CPU); num_workers=1 parses sequentially.
+    With sections_out_path, sections are written there as NDJSON (one per
+    line) as soon as they are complete instead of being returned.
+    """
+    if num_workers is None:
+        num_workers = min(os.cpu_count() or 1, 4)
+    
+    # GPT-4 Vision calls only wait on the network - run up to 10 at once
+    executor = ThreadPoolExecutor(max_workers=10)
+    parser = None
+    sections_out = None
     try:
-        doc = fitz.open(pdf_path)
+        doc = get_or_open(pdf_path)
         sections = []
+        total_sections = 0
+        if sections_out_path:
+            sections_out = open(sections_out_path, 'w', encoding='utf-8')
+        
+        def finish_section(section):
+            """Keep (or stream out) the first 20 meaningful sections and count them all"""
+            nonlocal total_sections
+            if len(section['blocks']) < 5:
+                return
+            total_sections += 1
+            if total_sections > 20:
+                return
+            if sections_out is not None:
+                json.dump(section, sections_out)
+                sections_out.write('\n')
+            else:
+                sections.append(section)
+        
         section_order = 0
         current_section = None
         in_metadata = True
@@ -112,51 +346,134 @@ def process_pdf_with_ai(pdf_path, output_dir, azure_endpoint, azure_key, deploym
             'total_tables': 0
         }
         
+        # Classification futures by image content hash, and (bytes, ext, future)
+        # by xref - repeated logos and icons are decoded once per xref and sent
+        # to GPT-4V once per distinct image
+        classifications = {}
+        seen_xrefs = {}
+        
+        # Pending image file writes
+        writes = []
+        
         print(f"Processing {len(doc)} pages with AI classification...", file=sys.stderr)
         
-        for page_num in range(len(doc)):
-            page = doc[page_num]
+        # Plan: walk the whole PDF once, starting every image's classification
+        # (with the heading of the section it falls in) before any result is
+        # awaited - the PDF's images are classified together, not page by page
+        page_text_blocks = []
+        page_candidates = []
+        page_table_blocks = []
+        page_pending = []
+        section_context = ""
+        
+        # Text, image lists and tables are parsed by worker processes (MuPDF
+        # work is CPU-bound and independent per page); the images themselves
+        # are still extracted here so repeated xrefs are only decoded once
+        if num_workers <= 1:
+            parsed_pages = (parse_page(pdf_path, page_num, output_dir) for page_num in range(len(doc)))
+        else:
+            parser = ProcessPoolExecutor(max_workers=num_workers)
+            parsed_pages = parser.map(
+                parse_page,
+                repeat(pdf_path),
+                range(len(doc)),
+                repeat(output_dir),
+                chunksize=2
+            )
+        
+        for page_num, parsed in enumerate(parsed_pages):
+            text_blocks = parsed['text_blocks']
+            page_text_blocks.append(text_blocks)
+            candidates = parsed['heading_candidates']
+            page_candidates.append(candidates)
+            page_table_blocks.append(parsed['table_blocks'])
+            
+            # Extract and classify images with AI
+            image_xrefs = parsed['image_xrefs']
+            tiny_xrefs = parsed['tiny_xrefs']
+            stats['total_images_found'] += len(image_xrefs)
             
+            # Follow the section headings the assembly pass below will find;
+            # images are classified with the section open at the top of the page
+            page_context = section_context
+            for block in text_blocks:
+                for line in block['content'].split('\n'):
+                    line = line.strip()
+                    if line not in candidates:
+                        continue
+                    kind, level = classify_line(line)
+                    if kind == 'heading' and (not section_context or level == 1):
+                        section_context = line
+            
+            # Front matter with no heading yet (cover, contents): its images never
+            # reach a section, so don't extract, classify or save them
+            if page_num < page_threshold and not section_context:
+                page_pending.append([])
+                continue
+            
+            # Extract on this thread (the document isn't thread-safe) and start
+            # each classification as soon as its image is decoded
+            pending = []
+            for img_index, xref in enumerate(image_xrefs):
+                # Decorative without decoding the image or asking GPT-4V
+                if xref in tiny_xrefs:
+                    stats['images_classified_decorative'] += 1
+                    continue
+                
+                try:
+                    if xref not in seen_xrefs:
+                        base_image = doc.extract_image(xref)
+                        image_bytes = base_image["image"]
+                        image_ext = base_image["ext"]
+                        key = hashlib.blake2b(image_bytes, digest_size=16).digest()
+                        
+                        if key not in classifications:
+                            print(f"  Page {page_num + 1}, Image {img_index + 1}: Classifying with AI...", file=sys.stderr)
+                            
+                            # Classify with AI, using the current section as context
+                            classifications[key] = executor.submit(
+                                classify_and_describe_image,
+                                image_bytes,
+                                image_ext,
+                                azure_endpoint,
+                                azure_key,
+                                deployment,
+                                context=page_context
+                            )
+                        seen_xrefs[xref] = (image_bytes, image_ext, classifications[key])
+                    
+                    image_bytes, image_ext, future = seen_xrefs[xref]
+                    pending.append((img_index, image_bytes, image_ext, future))
+                except Exception as e:
+                    print(f"Error processing image: {e}", file=sys.stderr)
+            page_pending.append(pending)
+        
+        if parser is not None:
+            parser.shutdown()
+            parser = None
+        
+        # Assemble: build the sections page by page as the classifications arrive
+        for page_num in range(len(doc)):
             if page_num >= page_threshold:
                 in_metadata = False
             
-            # Extract text blocks
-            text_blocks = extract_text_blocks(page)
-            
-            # Extract and classify images with AI
-            image_list = page.get_images()
+            text_blocks = page_text_blocks[page_num]
+            candidates = page_candidates[page_num]
+            pending = page_pending[page_num]
             image_blocks = []
-            stats['total_images_found'] += len(image_list)
-            
-            # Get current section context for better classification
-            section_context = current_section['heading'] if current_section else ""
             
-            for img_index, img in enumerate(image_list):
+            # Collect the classifications in image order
+            for img_index, image_bytes, image_ext, future in pending:
                 try:
-                    xref = img[0]
-                    base_image = doc.extract_image(xref)
-                    image_bytes = base_image["image"]
-                    image_ext = base_image["ext"]
-                    
-                    print(f"  Page {page_num + 1}, Image {img_index + 1}: Classifying with AI...", file=sys.stderr)
-                    
-                    # Classify with AI
-                    classification = classify_and_describe_image(
-                        image_bytes,
-                        image_ext,
-                        azure_endpoint,
-                        azure_key,
-                        deployment,
-                        context=section_context
-                    )
+                    classification = future.result()
                     
                     if classification['is_important']:
                         # Save important image
                         image_filename = f"page_{page_num + 1}_img_{img_index + 1}.{image_ext}"
                         image_path = os.path.join(output_dir, image_filename)
                         
-                        with open(image_path, "wb") as img_file:
-                            img_file.write(image_bytes)
+                        # Written from the pool so saving overlaps the assembly
+                        writes.append(executor.submit(_write_raw, image_path, image_bytes))
                         
                         stats['images_classified_important'] += 1
                         stats['images_saved'] += 1
@@ -189,63 +506,35 @@ def process_pdf_with_ai(pdf_path, output_dir, azure_endpoint, azure_key, deploym
                 except Exception as e:
                     print(f"Error processing image: {e}", file=sys.stderr)
             
-            # Extract tables
-            table_blocks = []
-            tables = page.find_tables()
-            
-            if tables and hasattr(tables, 'tables'):
-                for table_index, table in enumerate(tables.tables):
-                    try:
-                        bbox = table.bbox
-                        table_rect = fitz.Rect(bbox)
-                        pix = page.get_pixmap(clip=table_rect, matrix=fitz.Matrix(2, 2))
-                        
-                        table_filename = f"page_{page_num + 1}_table_{table_index + 1}.png"
-                        table_path = os.path.join(output_dir, table_filename)
-                        pix.save(table_path)
-                        
-                        stats['total_tables'] += 1
-                        
-                        table_blocks.append({
-                            'type': 'table',
-                            'content': table_filename,
-                            'x': bbox[0],
-                            'y': bbox[1],
-                            'width': bbox[2] - bbox[0],
-                            'height': bbox[3] - bbox[1],
-                            'metadata': {
-                                'is_table': True,
-                                'rows': len(table.rows) if hasattr(table, 'rows') else 0,
-                                'cols': len(table.header.cells) if hasattr(table, 'header') else 0
-                            }
-                        })
-                    except Exception as e:
-                        print(f"Error extracting table: {e}", file=sys.stderr)
+            table_blocks = page_table_blocks[page_num]
+            stats['total_tables'] += len(table_blocks)
             
-            # Combine and sort all blocks
-            all_blocks = text_blocks + image_blocks + table_blocks
-            sorted_blocks = sort_by_position(all_blocks)
+            # Combine all blocks: text and tables come sorted from parse_page and images are laid
+            # out top to bottom, so a linear merge puts them in reading order
+            sorted_blocks = heapq.merge(text_blocks, image_blocks, table_blocks, key=itemgetter('y', 'x'))
             
             # Process blocks to identify sections
             for block in sorted_blocks:
                 if block['type'] == 'text':
-                    content = block['content']
-                    lines = content.split('\n')
-                    
-                    for line in lines:
-                        line = line.strip()
-                        if not line:
+                    for line in map(str.strip, block['content'].split('\n')):
+                        # Lines under 4 characters can't be headings, front
+                        # matter or paragraph text - nothing to do for them
+                        if len(line) < 4:
                             continue
                         
-                        if in_metadata and is_metadata_section(line):
+                        # Only front matter and heading candidates need the full check
+                        if in_metadata or line in candidates:
+                            kind, level = classify_line(line)
+                        else:
+                            kind, level = 'body', 0
+                        
+                        if in_metadata and kind == 'meta':
                             continue
                         
-                        if is_heading(line, allow_questions=False):
-                            level = get_heading_level(line)
-                            
+                        if kind == 'heading':
                             if level == 1 or current_section is None:
                                 if current_section and len(current_section['blocks']) > 3:
-                                    sections.append(current_section)
+                                    finish_section(current_section)
                                     section_order += 1
                                 
                                 current_section = {
@@ -258,26 +547,12 @@ def process_pdf_with_ai(pdf_path, output_dir, azure_endpoint, azure_key, deploym
                                 }
                                 in_metadata = False
                         elif current_section and not in_metadata:
-                            if line and len(line) > 3:
-                                # Add line to current paragraph buffer
-                                current_section['current_paragraph'].append(line)
+                            # Add line to current paragraph buffer
+                            current_section['current_paragraph'].append(line)
                 
                 elif block['type'] == 'image' and current_section and not in_metadata:
                     # Flush current paragraph before adding image
-                    if current_section.get('current_paragraph'):
-                        paragraph_text = ' '.join(current_section['current_paragraph'])
-                        current_section['blocks'].append({
-                            'type': 'text',
-                            'content': paragraph_text,
-                            'order': len(current_section['blocks']),
-                            'bbox': {
-                                'x': 0,
-                                'y': 0,
-                                'width': 0,
-                                'height': 0
-                            }
-                        })
-                        current_section['current_paragraph'] = []
+                    _flush_paragraph(current_section)
                     
                     # Add image
                     current_section['blocks'].append({
@@ -295,20 +570,7 @@ def process_pdf_with_ai(pdf_path, output_dir, azure_endpoint, azure_key, deploym
                     
                 elif block['type'] == 'table' and current_section and not in_metadata:
                     # Flush current paragraph before adding table
-                    if current_section.get('current_paragraph'):
-                        paragraph_text = ' '.join(current_section['current_paragraph'])
-                        current_section['blocks'].append({
-                            'type': 'text',
-                            'content': paragraph_text,
-                            'order': len(current_section['blocks']),
-                            'bbox': {
-                                'x': 0,
-                                'y': 0,
-                                'width': 0,
-                                'height': 0
-                            }
-                        })
-                        current_section['current_paragraph'] = []
+                    _flush_paragraph(current_section)
                     
                     # Add table
                     current_section['blocks'].append({
@@ -325,19 +587,8 @@ def process_pdf_with_ai(pdf_path, output_dir, azure_endpoint, azure_key, deploym
                     })
         
         # Flush any remaining paragraph in the last section
-        if current_section and current_section.get('current_paragraph'):
-            paragraph_text = ' '.join(current_section['current_paragraph'])
-            current_section['blocks'].append({
-                'type': 'text',
-                'content': paragraph_text,
-                'order': len(current_section['blocks']),
-                'bbox': {
-                    'x': 0,
-                    'y': 0,
-                    'width': 0,
-                    'height': 0
-                }
-            })
+        if current_section:
+            _flush_paragraph(current_section)
             del current_section['current_paragraph']
         
         # Add last section
@@ -345,12 +596,15 @@ def process_pdf_with_ai(pdf_path, output_dir, azure_endpoint, azure_key, deploym
             # Clean up current_paragraph field if it exists
             if 'current_paragraph' in current_section:
                 del current_section['current_paragraph']
-            sections.append(current_section)
+            finish_section(current_section)
         
-        doc.close()
+        close_pdf(pdf_path)
         
-        # Filter meaningful sections
-        meaningful_sections = [s for s in sections if len(s['blocks']) >= 5]
+        for future in writes:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error saving image: {e}", file=sys.stderr)
         
         print(f"\n📊 AI Classification Statistics:", file=sys.stderr)
         print(f"  Total images found: {stats['total_images_found']}", file=sys.stderr)
@@ -359,12 +613,16 @@ def process_pdf_with_ai(pdf_path, output_dir, azure_endpoint, azure_key, deploym
         print(f"  Images saved: {stats['images_saved']}", file=sys.stderr)
         print(f"  Tables extracted: {stats['total_tables']}\n", file=sys.stderr)
         
-        return {
+        result = {
             'success': True,
-            'sections': meaningful_sections[:20],
-            'total_sections': len(meaningful_sections),
+            'total_sections': total_sections,
             'statistics': stats
         }
+        if sections_out is not None:
+            result['sections_path'] = sections_out_path
+        else:
+            result['sections'] = sections
+        return result
         
     except Exception as e:
         import traceback
@@ -379,12 +637,18 @@ def process_pdf_with_ai(pdf_path, output_dir, azure_endpoint, azure_key, deploym
             'error': error_msg,
             'traceback': traceback_str
         }
+    finally:
+        if sections_out is not None:
+            sections_out.close()
+        if parser is not None:
+            parser.shutdown()
+        executor.shutdown()
 
 if __name__ == '__main__':
     if len(sys.argv) < 6:
         result = {
             'success': False,
-            'error': 'Usage: python process_pdf_with_ai.py <pdf_path> <output_dir> <azure_endpoint> <azure_key> <deployment>'
+            'error': 'Usage: python process_pdf_with_ai.py <pdf_path> <output_dir> <azure_endpoint> <azure_key> <deployment> [sections_out_path]'
         }
         print(json.dumps(result))
         sys.exit(1)
@@ -394,10 +658,14 @@ if __name__ == '__main__':
     azure_endpoint = sys.argv[3]
     azure_key = sys.argv[4]
     deployment = sys.argv[5]
+    sections_out_path = sys.argv[6] if len(sys.argv) > 6 else None
     
     try:
-        result = process_pdf_with_ai(pdf_path, output_dir, azure_endpoint, azure_key, deployment)
-        print(json.dumps(result, indent=2))
+        result = process_pdf_with_ai(
+            pdf_path, output_dir, azure_endpoint, azure_key, deployment,
+            sections_out_path=sections_out_path
+        )
+        print_json(result)
     except Exception as e:
         error_result = {
             'success': False,
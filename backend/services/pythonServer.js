@@ -0,0 +1,89 @@
+const { spawn } = require('child_process');
+const readline = require('readline');
+
+/**
+ * A Python script kept running in its --server mode
+ * Requests are written to its stdin as JSON lines and answered in order on
+ * stdout, so the interpreter and its imports (PyMuPDF, openai, LlamaParse)
+ * start once instead of once per PDF. The process is started on the first
+ * request and restarted on the next one if it exits.
+ */
+class PythonServer {
+    /**
+     * @param {string} pythonPath - Python interpreter to run
+     * @param {string} scriptPath - Script that accepts --server
+     */
+    constructor(pythonPath, scriptPath) {
+        this.pythonPath = pythonPath;
+        this.scriptPath = scriptPath;
+        this.child = null;
+        this.pending = [];
+    }
+
+    start() {
+        const child = spawn(this.pythonPath, [this.scriptPath, '--server'], {
+            stdio: ['pipe', 'pipe', 'pipe']
+        });
+
+        // One response line per request, in request order
+        readline.createInterface({ input: child.stdout }).on('line', (line) => {
+            let response;
+            try {
+                response = JSON.parse(line);
+            } catch (error) {
+                // Not a response (e.g. a library warning printed at import)
+                console.log(line);
+                return;
+            }
+            const request = this.pending.shift();
+            if (request) {
+                request.resolve(response);
+            }
+        });
+
+        // Progress logging from the script
+        child.stderr.on('data', (data) => process.stdout.write(data));
+
+        const fail = (error) => {
+            if (this.child === child) {
+                this.child = null;
+            }
+            for (const request of this.pending.splice(0)) {
+                request.reject(error);
+            }
+        };
+        child.on('error', fail);
+        child.on('exit', (code) => {
+            fail(new Error(`${this.scriptPath} exited with code ${code}`));
+        });
+
+        this.child = child;
+    }
+
+    /**
+     * Send one request and wait for its response
+     * @param {Object} request - Request fields, named like the script's CLI arguments
+     * @returns {Promise<Object>} The script's result object
+     */
+    request(request) {
+        if (!this.child) {
+            this.start();
+        }
+        return new Promise((resolve, reject) => {
+            this.pending.push({ resolve, reject });
+            this.child.stdin.write(JSON.stringify(request) + '\n');
+        });
+    }
+
+    /**
+     * Let the script exit once it has answered the requests already sent
+     */
+    close() {
+        if (this.child) {
+            this.child.stdin.end();
+            this.child = null;
+        }
+    }
+}
+
+module.exports = { PythonServer };
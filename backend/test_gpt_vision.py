@@ -6,13 +6,75 @@ Tests with a sample image from the PDF uploads
 
 import sys
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Add parent directory to path to import classify_image_enhanced
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'services'))
 
-from classify_image_enhanced import classify_and_describe_image
+from classify_image_enhanced import classify_and_describe_image, _prepare_image
 import json
 
+def test_concurrency(uploads_dir, azure_endpoint, azure_key, deployment, batch_size=8):
+    """
+    Classify a batch of images sequentially and with a thread pool
+    Fails unless the pool is at least 2x faster, so an accidental
+    serialization inside the classifier (e.g. a shared lock) shows up here
+    """
+    print("\n7. Testing concurrent classification...")
+    
+    # Only time images that actually reach the API - small icons and flat
+    # backgrounds are answered locally and would skew the comparison
+    images = []
+    for filename in sorted(os.listdir(uploads_dir)):
+        if filename.endswith(('.jpeg', '.jpg', '.png')):
+            with open(os.path.join(uploads_dir, filename), 'rb') as f:
+                image = (f.read(), os.path.splitext(filename)[1][1:])
+            if _prepare_image(*image)[0] is None:
+                images.append(image)
+            if len(images) == batch_size:
+                break
+    
+    if len(images) < 2:
+        print(f"   - Skipped: need at least 2 non-decorative images in {uploads_dir}")
+        return True
+    
+    def classify(image):
+        image_bytes, image_format = image
+        return classify_and_describe_image(
+            image_bytes,
+            image_format,
+            azure_endpoint,
+            azure_key,
+            deployment,
+            context="Concurrency test",
+            # Bypass the cache so both runs really go to the API, and nothing
+            # from the test is saved to ~/.cache/summarizer/classify.json
+            use_cache=False
+        )
+    
+    start = time.perf_counter()
+    for image in images:
+        classify(image)
+    sequential = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=batch_size) as executor:
+        list(executor.map(classify, images))
+    parallel = time.perf_counter() - start
+    
+    speedup = sequential / parallel if parallel > 0 else float('inf')
+    print(f"   Images:      {len(images)}")
+    print(f"   Sequential:  {sequential:.1f}s")
+    print(f"   Parallel:    {parallel:.1f}s ({speedup:.1f}x)")
+    
+    if speedup < 2:
+        print("   ❌ Parallel classification is less than 2x faster")
+        return False
+    
+    print("   ✓ Classification calls run concurrently")
+    return True
+
 def test_gpt_vision():
     """Test GPT-4 Vision with a sample image"""
     
@@ -112,6 +174,13 @@ def test_gpt_vision():
         print("\n6. Full JSON Response:")
         print(json.dumps(result, indent=2))
         
+        # Concurrent classification must actually overlap the API calls
+        if not test_concurrency(uploads_dir, azure_endpoint, azure_key, deployment):
+            print("\n" + "=" * 60)
+            print("❌ GPT-4 Vision concurrency test failed")
+            print("=" * 60)
+            return False
+        
         print("\n" + "=" * 60)
         print("✅ GPT-4 Vision is working correctly!")
         print("=" * 60)
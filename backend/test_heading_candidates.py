@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Test that heading_candidates never drops a heading
+Every line classify_line accepts as a heading must be among the page's
+candidates, otherwise process_pdf_with_ai treats it as body text
+"""
+
+import sys
+import os
+import random
+
+# Add services directory to path to import process_pdf_with_ai
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'services'))
+
+from process_pdf_with_ai import classify_line, heading_candidates
+
+# Lines that must stay separate candidates: page numbers and blank lines
+# directly above headings, indented and whitespace-padded headings
+SAMPLE_BLOCKS = [
+    '12\nINTRODUCTION TO WORKPLACE SAFETY\nWear protective equipment at all times.',
+    '3\n\n1.1 Overview\nThis unit covers the basics.',
+    '  \nUNIT 2 Customer Service\n 7 \nChapter 4\tCommunication',
+    'Page 5\n   2 Handling Complaints   \nKEY LEARNING OUTCOMES',
+    '\t\nSECTION 10\n\x0c\nA Short Line\nCUSTOMER SERVICE SKILLS OVERVIEW',
+]
+
+def random_block(rng):
+    """A block of lines mixing headings, page numbers, whitespace and body text"""
+    templates = [
+        '{n}', '{ws}{n}{ws}', '', '{ws}',
+        '{ws}{n}.{n} {Word} {word}{ws}',
+        '{ws}{n} {Word} {word}',
+        '{ws}{unit} {n} {word}',
+        '{ws}{CAPS}{ws}',
+        '{Word} {word} {word} {word}',
+    ]
+    lines = []
+    for _ in range(rng.randint(1, 8)):
+        lines.append(rng.choice(templates).format(
+            n=rng.randint(0, 99),
+            ws=rng.choice(['', ' ', '\t', '  ', '\r', '\x0c']),
+            Word=rng.choice(['Introduction', 'Safety', 'Overview', 'Éthique']),
+            word=rng.choice(['skills', 'at work', 'and tools', 'é']),
+            unit=rng.choice(['UNIT', 'Chapter', 'module', 'Section', 'TOPIC']),
+            CAPS=' '.join(rng.choice(['CUSTOMER', 'SERVICE', 'SAFETY', 'SKILLS', 'Ⅻ'])
+                          for _ in range(rng.randint(1, 5)))
+        ))
+    return '\n'.join(lines)
+
+def check_page(contents):
+    """Return the heading lines of a page missing from its candidates"""
+    text_blocks = [{'content': content} for content in contents]
+    candidates = heading_candidates(text_blocks)
+
+    missing = []
+    for content in contents:
+        for line in content.split('\n'):
+            line = line.strip()
+            if classify_line(line)[0] == 'heading' and line not in candidates:
+                missing.append(line)
+
+    # A candidate is one stripped line, never several joined together
+    missing.extend(candidate for candidate in candidates if '\n' in candidate)
+    return missing
+
+def test_heading_candidates():
+    """Compare heading_candidates against classify_line on every line"""
+    missing = check_page(SAMPLE_BLOCKS)
+
+    rng = random.Random(0)
+    for _ in range(2000):
+        missing.extend(check_page([random_block(rng) for _ in range(rng.randint(1, 4))]))
+
+    for line in missing[:10]:
+        print(f"   ❌ Heading not a candidate: {line!r}")
+    assert not missing, f"{len(missing)} headings missed by heading_candidates"
+
+if __name__ == '__main__':
+    try:
+        test_heading_candidates()
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print("✅ heading_candidates covers every heading")
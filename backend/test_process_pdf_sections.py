@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Test that process_pdf.py never turns running headers or footers into headings
+Builds a small PDF whose pages repeat a bold header, a larger running title
+and a page number, with sections running on over several pages, and checks
+that only the real headings start sections
+"""
+
+import sys
+import os
+import tempfile
+import fitz  # PyMuPDF
+
+from process_pdf import extract_pages, build_sections
+
+BODY_LINE = "Body text that runs long enough to make every section meaningful."
+
+# Heading on each page, or None where the previous section continues
+PAGES = [
+    "Introduction to Security",
+    None,
+    "Types of Attacks",
+    None,
+    None,
+    "Let's Summarize",
+]
+
+def build_pdf(path):
+    """Write a PDF with a running header, running title and page numbers on every page"""
+    doc = fitz.open()
+    for page_num, heading in enumerate(PAGES):
+        page = doc.new_page()
+        # Running header: bold at body size; running title: larger than body text
+        page.insert_text((70, 36), "Participant Handbook", fontname="hebo", fontsize=11)
+        page.insert_text((300, 36), "Penetration Tester", fontname="helv", fontsize=16)
+        if heading:
+            page.insert_text((72, 110), heading, fontname="hebo", fontsize=18)
+        for i in range(6):
+            page.insert_text((72, 140 + 14 * i), BODY_LINE, fontname="helv", fontsize=11)
+        page.insert_text((295, 810), str(page_num + 1), fontname="helv", fontsize=11)
+    doc.save(path)
+    doc.close()
+
+def test_repeated_header():
+    """Headers and footers repeated on every page are body text, not headings"""
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, 'repeated_header.pdf')
+        build_pdf(pdf_path)
+        sections = build_sections(extract_pages(pdf_path))
+    
+    headings = [section['heading'] for section in sections]
+    expected = [heading for heading in PAGES if heading]
+    assert headings == expected, f"Expected headings {expected}, got {headings}"
+
+if __name__ == '__main__':
+    try:
+        test_repeated_header()
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print("✅ Running headers and footers are not headings")
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Test that the get_text("blocks") readers split pages into the same text
+blocks as the original get_text("dict") extraction, on the sample PDF
+A change in block boundaries moves or merges headings between sections
+"""
+
+import sys
+import os
+import fitz  # PyMuPDF
+
+# Add services directory to path to import the block readers
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'services'))
+
+from pdf_blocks import extract_text_blocks
+import process_pdf_llm
+import process_pdf_with_ai
+
+SAMPLE_PDF = os.path.join(os.path.dirname(__file__), '..', 'test-sample.pdf')
+
+def dict_blocks(page):
+    """Text and bbox of each text block, read the original way from get_text("dict")"""
+    blocks = []
+    for block in page.get_text("dict").get("blocks", []):
+        if block.get("type") == 0:
+            text = ""
+            for line in block.get("lines", []):
+                for span in line.get("spans", []):
+                    text += span.get("text", "")
+                text += "\n"
+            if text.strip():
+                blocks.append((text.strip(), tuple(block["bbox"])))
+    return blocks
+
+def check_reader(doc, read_blocks):
+    """Return the 1-based page numbers where read_blocks differs from dict_blocks"""
+    differing = []
+    for page in doc:
+        expected = [(text, tuple(round(v, 2) for v in bbox)) for text, bbox in dict_blocks(page)]
+        actual = [(text, tuple(round(v, 2) for v in bbox)) for text, bbox in read_blocks(page)]
+        if actual != expected:
+            differing.append(page.number + 1)
+    return differing
+
+def pdf_blocks_reader(page):
+    """(text, bbox) of each block from pdf_blocks.extract_text_blocks"""
+    return [
+        (block.content, (block.x, block.y, block.x + block.width, block.y + block.height))
+        for block in extract_text_blocks(page)
+    ]
+
+def dict_reader(extract):
+    """(text, bbox) of each block from an extract_text_blocks returning dicts"""
+    def read_blocks(page):
+        return [
+            (block['content'], (block['x'], block['y'], block['x'] + block['width'], block['y'] + block['height']))
+            for block in extract(page)
+        ]
+    return read_blocks
+
+READERS = {
+    'pdf_blocks': pdf_blocks_reader,
+    'process_pdf_with_ai': dict_reader(process_pdf_with_ai.extract_text_blocks),
+    'process_pdf_llm': dict_reader(process_pdf_llm.extract_text_blocks),
+}
+
+def test_text_blocks():
+    """Compare every block reader against get_text("dict") on each page of the sample"""
+    if not os.path.exists(SAMPLE_PDF):
+        print(f"   - Skipped: {SAMPLE_PDF} not found")
+        return
+    
+    failures = []
+    with fitz.open(SAMPLE_PDF) as doc:
+        for name, read_blocks in READERS.items():
+            differing = check_reader(doc, read_blocks)
+            if differing:
+                print(f"   ❌ {name}: blocks differ on pages {differing}")
+                failures.append(name)
+    assert not failures, f"Block segmentation changed in {', '.join(failures)}"
+
+if __name__ == '__main__':
+    try:
+        test_text_blocks()
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print("✅ Text blocks match the original segmentation")